@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# uvicorn has no post_worker_init (see gunicorn.conf.py); each worker imports this module, so it warms up here.
+from src.warmup import warm_up_in_background  # noqa: E402
+
+warm_up_in_background()
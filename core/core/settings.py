@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'src.profiling.RpcProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'core.urls'
@@ -77,9 +78,32 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        # Writers take the lock at BEGIN and wait for it, instead of failing with
+        # "database is locked" when a read lock cannot be upgraded mid-transaction.
+        # This applies to every atomic() block, read-only ones included, so those
+        # queue behind writers too; plain autocommit reads are not affected.
+        # transaction_mode needs Django 5.1+.
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
 
+# Transfer rows are hash-sharded by ext_id across these aliases; with no
+# shards configured everything stays on 'default'.
+TRANSFER_SHARD_COUNT = int(os.environ.get('TRANSFER_SHARD_COUNT', '0'))
+TRANSFER_SHARDS = [f'transfers_{index}' for index in range(TRANSFER_SHARD_COUNT)]
+for alias in TRANSFER_SHARDS:
+    DATABASES[alias] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / f'{alias}.sqlite3',
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': DATABASES['default']['OPTIONS'],
+    }
+
+DATABASE_ROUTERS = ['src.sharding.TransferShardRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -121,3 +145,79 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Card import uploads are never served; keep them outside MEDIA_ROOT.
+CARD_IMPORT_ROOT = os.path.join(BASE_DIR, 'private', 'card_imports')
+
+NOTIFIER = {
+    'GATEWAY_URL': os.environ.get('NOTIFIER_GATEWAY_URL', ''),
+    'POOL_SIZE': 4,
+    'TIMEOUT': 2.0,
+    'RETRIES': 3,
+    # Total time a send may spend across retries; transfer_create waits on it.
+    'DEADLINE': 3.0,
+    'RATE': 30.0,
+    'BURST': 30,
+    'BATCH_SIZE': 100,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'src.logs.SamplingFilter',
+            'rates': {'rpc_call': 0.01, 'notify': 0.1, 'rpc_overloaded': 0.01},
+            'exception_limit': 10,
+            'exception_window': 60.0,
+        },
+    },
+    'formatters': {
+        'json': {'()': 'src.logs.JsonFormatter'},
+    },
+    'handlers': {
+        'background': {
+            '()': 'src.logs.BackgroundQueueHandler',
+            'filters': ['sampling'],
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'src': {'handlers': ['background'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+RPC_ADMISSION = {
+    'ENABLED': os.environ.get('RPC_ADMISSION', '1') == '1',
+    'CLASSES': {
+        'write': {'LIMIT': 8, 'QUEUE': 16, 'TIMEOUT': 0.5},
+        'read': {'LIMIT': 16, 'QUEUE': 8, 'TIMEOUT': 0.1},
+    },
+    'RETRY_AFTER': 1.0,
+}
+
+# Deleted-card tombstones feed delta exports; consumers whose watermark is
+# older than this must start over with a full export.
+CARD_TOMBSTONE_RETENTION_DAYS = 30
+
+# Confirmations for the same sender card are coalesced per worker process;
+# row locks still serialize them across processes.
+CARD_WRITE_QUEUE = {
+    'ENABLED': os.environ.get('CARD_WRITE_QUEUE', '1') == '1',
+    'MAX_BATCH': 100,
+}
+
+# gunicorn workers warm up in post_worker_init (see gunicorn.conf.py) before their first request.
+WARMUP = {
+    'CARD_DIRECTORY': True,
+}
+
+IMPORT_TIME_BUDGET_MS = int(os.environ.get('IMPORT_TIME_BUDGET_MS', '1500'))
+
+RPC_PROFILING = {
+    'ENABLED': os.environ.get('RPC_PROFILING') == '1',
+    'SAMPLE_RATE': float(os.environ.get('RPC_PROFILING_SAMPLE_RATE', '0.001')),
+    'PROFILER': os.environ.get('RPC_PROFILING_PROFILER', 'cprofile'),
+    'DIR': BASE_DIR / 'profiles',
+    'MAX_FILES': 500,
+}
@@ -0,0 +1,9 @@
+wsgi_app = "core.wsgi:application"
+
+
+def post_worker_init(worker):
+    # Without preload_app each worker imports the app itself, so it warms up here, after loading it and
+    # in its serving thread, which also opens that thread's database connections.
+    from src.warmup import warm_up
+
+    warm_up()
@@ -1,11 +1,15 @@
 from django import forms
 from django.contrib import admin, messages
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse, QueryDict
+from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
-from django.urls import path
+from django.urls import path, reverse
 
-from .models import Card, Error, Transfer
-from .utils import format_card, format_phone, normalize_expire, parse_balance, read_simple_xlsx
+from .models import Card, CardImportJob, CardSummary, Error, Transfer
+from .sharding import transfer_shards
+from .utils import BALANCE_BUCKET_CHOICES, BALANCE_LOW_LIMIT, BALANCE_MID_LIMIT, format_card, format_phone
+
+IMPORT_STATUS_FIELDS = ("status", "total_rows", "processed_rows", "imported_count", "error_count", "failure")
 
 
 class BalanceRangeFilter(admin.SimpleListFilter):
@@ -13,25 +17,51 @@ class BalanceRangeFilter(admin.SimpleListFilter):
     parameter_name = "balance_range"
 
     def lookups(self, request, model_admin):
-        return [
-            ("zero", "0"),
-            ("low", "0 - 10,000"),
-            ("mid", "10,000 - 1,000,000"),
-            ("high", "1,000,000+"),
-        ]
+        return BALANCE_BUCKET_CHOICES
 
     def queryset(self, request, queryset):
         value = self.value()
         if value == "zero":
             return queryset.filter(balance=0)
         if value == "low":
-            return queryset.filter(balance__gt=0, balance__lte=10_000)
+            return queryset.filter(balance__gt=0, balance__lte=BALANCE_LOW_LIMIT)
         if value == "mid":
-            return queryset.filter(balance__gt=10_000, balance__lte=1_000_000)
+            return queryset.filter(balance__gt=BALANCE_LOW_LIMIT, balance__lte=BALANCE_MID_LIMIT)
         if value == "high":
-            return queryset.filter(balance__gt=1_000_000)
+            return queryset.filter(balance__gt=BALANCE_MID_LIMIT)
+        return queryset
+
+
+def selected_shard(request):
+    shards = transfer_shards()
+    # Change and delete pages carry the changelist's filters in _changelist_filters.
+    shard = request.GET.get("shard") or QueryDict(request.GET.get("_changelist_filters", "")).get("shard")
+    return shard if shard in shards else shards[0]
+
+
+class TransferShardFilter(admin.SimpleListFilter):
+    title = "shard"
+    parameter_name = "shard"
+
+    def lookups(self, request, model_admin):
+        shards = transfer_shards()
+        return [(alias, alias) for alias in shards] if len(shards) > 1 else []
+
+    def value(self):
+        return super().value() or transfer_shards()[0]
+
+    def queryset(self, request, queryset):
         return queryset
 
+    def choices(self, changelist):
+        # One shard at a time: there is no "All" entry.
+        for lookup, title in self.lookup_choices:
+            yield {
+                "selected": self.value() == lookup,
+                "query_string": changelist.get_query_string({self.parameter_name: lookup}),
+                "display": title,
+            }
+
 
 class CardImportForm(forms.Form):
     excel_file = forms.FileField(label="Excel file (.xlsx)")
@@ -57,6 +87,16 @@ class CardAdmin(admin.ModelAdmin):
         urls = super().get_urls()
         custom_urls = [
             path("import-excel/", self.admin_site.admin_view(self.import_excel), name="cards-import"),
+            path(
+                "import-jobs/<int:job_id>/",
+                self.admin_site.admin_view(self.import_progress),
+                name="cards-import-progress",
+            ),
+            path(
+                "import-jobs/<int:job_id>/status/",
+                self.admin_site.admin_view(self.import_status),
+                name="cards-import-status",
+            ),
         ]
         return custom_urls + urls
 
@@ -65,12 +105,9 @@ class CardAdmin(admin.ModelAdmin):
             form = CardImportForm(request.POST, request.FILES)
             if form.is_valid():
                 excel_file = form.cleaned_data["excel_file"]
-                created, errors = self._import_cards_from_excel(excel_file)
-                if created:
-                    messages.success(request, f"Imported {created} cards.")
-                for error in errors:
-                    messages.error(request, error)
-                return HttpResponseRedirect("../")
+                job = CardImportJob.objects.create(file=excel_file, original_name=excel_file.name)
+                messages.info(request, f"Queued {job.original_name} for import.")
+                return HttpResponseRedirect(reverse("admin:cards-import-progress", args=[job.pk]))
         else:
             form = CardImportForm()
 
@@ -82,55 +119,50 @@ class CardAdmin(admin.ModelAdmin):
         }
         return TemplateResponse(request, "admin/cards_import.html", context)
 
-    def _import_cards_from_excel(self, excel_file):
-        rows = read_simple_xlsx(excel_file)
-        if not rows:
-            return 0, ["Excel file is empty."]
-
-        header = [cell.strip().lower() for cell in rows[0]]
-        expected = ["card_number", "expire", "phone", "status", "balance"]
-        if header[: len(expected)] != expected:
-            return 0, ["Invalid header. Expected: card_number, expire, phone, status, balance"]
-
-        created = 0
-        errors = []
-        for index, row in enumerate(rows[1:], start=2):
-            if not any(row):
-                continue
-            data = dict(zip(expected, row))
-            card_number = format_card(data.get("card_number"), digits_only=True)
-            expire = normalize_expire(data.get("expire"))
-            phone = format_phone(data.get("phone"), digits_only=True)
-            status = str(data.get("status", "")).strip().lower()
-            balance = parse_balance(data.get("balance"))
-
-            row_errors = []
-            if len(card_number) != 16:
-                row_errors.append("card_number must be 16 digits")
-            if not expire or len(expire) != 7:
-                row_errors.append("expire must be in YYYY-MM")
-            if phone and len(phone) not in {9, 12}:
-                row_errors.append("phone must be 9 or 12 digits")
-            if status not in dict(Card.STATUS_CHOICES):
-                row_errors.append("status must be active, inactive, or expired")
-            if balance is None:
-                row_errors.append("balance must be numeric")
-
-            if row_errors:
-                errors.append(f"Row {index}: {', '.join(row_errors)}")
-                continue
-
-            Card.objects.update_or_create(
-                card_number=card_number,
-                defaults={
-                    "expire": expire,
-                    "phone": phone,
-                    "status": status,
-                    "balance": balance,
-                },
-            )
-            created += 1
-        return created, errors
+    def import_progress(self, request, job_id):
+        job = get_object_or_404(CardImportJob, pk=job_id)
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "job": job,
+            "status_url": reverse("admin:cards-import-status", args=[job.pk]),
+            "title": f"Importing {job.original_name}",
+        }
+        return TemplateResponse(request, "admin/cards_import_progress.html", context)
+
+    def import_status(self, request, job_id):
+        status = CardImportJob.objects.filter(pk=job_id).values(*IMPORT_STATUS_FIELDS).first()
+        if status is None:
+            raise Http404
+        finished = status["status"] in {CardImportJob.STATUS_DONE, CardImportJob.STATUS_FAILED}
+        return JsonResponse({**status, "finished": finished})
+
+
+@admin.register(CardImportJob)
+class CardImportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "original_name",
+        "status",
+        "progress_display",
+        "imported_count",
+        "error_count",
+        "worker",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status",)
+    search_fields = ("original_name",)
+    # The upload is deleted once a job settles and is never served, so the admin does not link to it.
+    exclude = ("file",)
+    readonly_fields = [field.name for field in CardImportJob._meta.fields if field.name != "file"]
+
+    def progress_display(self, obj):
+        return f"{obj.progress}% ({obj.processed_rows}/{obj.total_rows})"
+
+    progress_display.short_description = "Progress"
+
+    def has_add_permission(self, request):
+        return False
 
 
 @admin.register(Transfer)
@@ -144,8 +176,25 @@ class TransferAdmin(admin.ModelAdmin):
         "currency",
         "created_at",
     )
-    list_filter = ("state", "currency", "created_at")
+    list_filter = (TransferShardFilter, "state", "currency", "created_at")
     search_fields = ("ext_id", "sender_card_number", "receiver_card_number")
+    # The full count would come from 'default', which holds no transfers once sharded.
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(selected_shard(request))
+
+
+@admin.register(CardSummary)
+class CardSummaryAdmin(admin.ModelAdmin):
+    list_display = ("status", "bucket", "card_count", "total_balance", "updated_at")
+    list_filter = ("status", "bucket")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Error)
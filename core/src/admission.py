@@ -0,0 +1,194 @@
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core import signing
+
+OVERLOADED = 32715
+OVERLOADED_MESSAGE = "Service is overloaded, retry later"
+SIGNER_SALT = "src.admission"
+
+DEFAULTS = {
+    "ENABLED": True,
+    # Listed from most to least important: a class is shed while any class above it has waiters.
+    "CLASSES": {
+        "write": {"LIMIT": 8, "QUEUE": 16, "TIMEOUT": 0.5},
+        "read": {"LIMIT": 16, "QUEUE": 8, "TIMEOUT": 0.1},
+    },
+    "METHODS": {
+        "transfer_create": "write",
+        "transfer_confirm": "write",
+        "transfer_cancel": "write",
+        "transfer_create_batch": "write",
+        "transfer_confirm_batch": "write",
+        "transfer_state": "read",
+        "transfer_history": "read",
+        "card_summary": "read",
+        "transfer_summary": "read",
+    },
+    "RETRY_AFTER": 1.0,
+    "STATS_TOKEN_MAX_AGE": 300,
+}
+
+
+class Overloaded(Exception):
+    def __init__(self, kind, retry_after):
+        super().__init__(f"{kind} requests overloaded")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class AdmissionClass:
+    def __init__(self, name, lock, limit, queue, timeout):
+        self.name = name
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.condition = threading.Condition(lock)
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "active": self.active,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionController:
+    def __init__(self, classes, methods, retry_after=1.0):
+        self._lock = threading.Lock()
+        self.classes = {
+            name: AdmissionClass(name, self._lock, config["LIMIT"], config["QUEUE"], config["TIMEOUT"])
+            for name, config in classes.items()
+        }
+        self.priority = list(self.classes)
+        self.methods = methods
+        self.retry_after = retry_after
+
+    def classify(self, names):
+        kinds = {self.methods.get(name) for name in names} - {None}
+        for kind in self.priority:
+            if kind in kinds:
+                return kind
+        return None
+
+    def _higher_waiting(self, admission_class):
+        for kind in self.priority:
+            if kind == admission_class.name:
+                return False
+            if self.classes[kind].waiting:
+                return True
+        return False
+
+    def _reject(self, admission_class):
+        pressure = admission_class.waiting / admission_class.queue if admission_class.queue else 1.0
+        # Jitter keeps rejected clients from coming back in lockstep.
+        retry_after = self.retry_after * (1 + pressure) * random.uniform(1.0, 1.5)
+        return Overloaded(admission_class.name, round(retry_after, 1))
+
+    def _acquire(self, admission_class, weight):
+        deadline = time.monotonic() + admission_class.timeout
+        queued = False
+        try:
+            while True:
+                if self._higher_waiting(admission_class):
+                    admission_class.shed += 1
+                    admission_class.rejected += 1
+                    raise self._reject(admission_class)
+                if admission_class.active + weight <= admission_class.limit:
+                    return
+                if not queued:
+                    if admission_class.waiting >= admission_class.queue:
+                        admission_class.rejected += 1
+                        raise self._reject(admission_class)
+                    queued = True
+                    admission_class.waiting += 1
+                    self._wake_lower(admission_class)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    admission_class.timed_out += 1
+                    admission_class.rejected += 1
+                    raise self._reject(admission_class)
+                admission_class.condition.wait(remaining)
+        finally:
+            if queued:
+                admission_class.waiting -= 1
+
+    def _wake_lower(self, admission_class):
+        # Lower classes re-check on wake-up and give way to the queued work.
+        for kind in self.priority[self.priority.index(admission_class.name) + 1 :]:
+            self.classes[kind].condition.notify_all()
+
+    @contextmanager
+    def admit(self, names):
+        kind = self.classify(names)
+        if kind is None:
+            yield None
+            return
+        admission_class = self.classes[kind]
+        # A JSON-RPC batch holds one slot per call, capped so a large batch can still be admitted.
+        calls = sum(1 for name in names if name in self.methods)
+        weight = max(1, min(calls, admission_class.limit))
+        with self._lock:
+            self._acquire(admission_class, weight)
+            admission_class.active += weight
+            admission_class.admitted += 1
+        try:
+            yield kind
+        finally:
+            with self._lock:
+                admission_class.active -= weight
+                admission_class.condition.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {name: admission_class.stats() for name, admission_class in self.classes.items()}
+
+
+def stats_token():
+    return signing.TimestampSigner(salt=SIGNER_SALT).sign("admission_stats")
+
+
+def valid_stats_token(token):
+    max_age = {**DEFAULTS, **getattr(settings, "RPC_ADMISSION", {})}["STATS_TOKEN_MAX_AGE"]
+    try:
+        return signing.TimestampSigner(salt=SIGNER_SALT).unsign(str(token), max_age=max_age) == "admission_stats"
+    except signing.BadSignature:
+        return False
+
+
+def retry_after_header(retry_after):
+    return str(max(1, math.ceil(retry_after)))
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def build_admission_controller(config=None):
+    config = {**DEFAULTS, **(config or {})}
+    methods = config["METHODS"] if config["ENABLED"] else {}
+    return AdmissionController(config["CLASSES"], methods, config["RETRY_AFTER"])
+
+
+def get_admission_controller():
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = build_admission_controller(getattr(settings, "RPC_ADMISSION", None))
+    return _controller
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class SrcConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
     name = 'src'
+
+    def ready(self):
+        from . import views  # noqa: F401  registers the JSON-RPC methods
@@ -0,0 +1,222 @@
+import gc
+import io
+import random
+import time
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from .utils import (
+    card_mask,
+    format_card,
+    format_phone,
+    luhn_check_digit,
+    normalize_expire,
+    parse_balance,
+    prepare_message,
+    read_simple_xlsx,
+    validate_card,
+)
+
+SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+XLSX_ROWS = 500
+
+
+def build_simple_xlsx(rows):
+    cells = []
+    for index, row in enumerate(rows, start=1):
+        cells.append(f'<row r="{index}">')
+        for value in row:
+            cells.append(f'<c t="inlineStr"><is><t>{escape(str(value))}</t></is></c>')
+        cells.append("</row>")
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("xl/worksheets/sheet1.xml", SHEET_HEADER + "".join(cells) + "</sheetData></worksheet>")
+    return buffer.getvalue()
+
+
+CASES = {
+    "format_card": [
+        (("8600123412341234",), "8600 1234 1234 1234"),
+        (("8600 1234-1234.1234",), "8600 1234 1234 1234"),
+        ((8600123412341234,), "8600 1234 1234 1234"),
+        (("8600 1234 1234 1234", True), "8600123412341234"),
+        ((None,), ""),
+        (("",), ""),
+    ],
+    "format_phone": [
+        (("998901234567",), "+998 90 123 45 67"),
+        (("+998 (90) 123-45-67", True), "998901234567"),
+        (("901234567",), "90 123 45 67"),
+        (("12345",), "12345"),
+        ((None,), ""),
+    ],
+    "normalize_expire": [
+        (("2030-01",), "2030-01"),
+        (("2030.1",), "2030-01"),
+        (("01/30",), "2030-01"),
+        ((" 1/2030 ",), "2030-01"),
+        (("12-31",), "2031-12"),
+        (("2030/01/01",), "2030/01/01"),
+        (("soon",), "soon"),
+        ((None,), ""),
+    ],
+    "card_mask": [
+        (("8600123412341234",), "**** **** **** 1234"),
+        (("8600 1234 1234 9876",), "**** **** **** 9876"),
+        (("1234",), "1234"),
+        (("",), ""),
+    ],
+    "validate_card": [
+        (("4532015112830366",), True),
+        (("4532 0151 1283 0366",), True),
+        (("4111111111111111",), True),
+        (("4532015112830367",), False),
+        (("8600123412341234",), False),
+        (("0",), True),
+        (("",), False),
+    ],
+    "parse_balance": [
+        (("1,234.56",), Decimal("1234.56")),
+        ((" 100 ",), Decimal("100")),
+        ((0,), Decimal("0")),
+        (("",), None),
+        ((None,), None),
+        (("abc",), None),
+    ],
+    "prepare_message": [
+        (
+            ("8600123412341234", "1234567.5"),
+            "Sizning kartangiz **** **** **** 1234 aktiv va foydalanishga 1,234,567.50 UZS mavjud!",
+        ),
+        (
+            ("4532015112830366", 0, "EN"),
+            "Sizning kartangiz **** **** **** 0366 aktiv va foydalanishga 0.00 UZS mavjud!",
+        ),
+    ],
+    "read_simple_xlsx": [
+        (
+            (build_simple_xlsx([["card_number", "balance"], ["8600 1234", ""], ["<&>", 5]]),),
+            [["card_number", "balance"], ["8600 1234", ""], ["<&>", "5"]],
+        ),
+    ],
+}
+
+
+def _card_number(rng, valid=True):
+    partial = f"8600{rng.randrange(10**11):011d}"
+    check = luhn_check_digit(partial)
+    return partial + (check if valid else str((int(check) + 1) % 10))
+
+
+def _raw_card(rng):
+    number = _card_number(rng, valid=rng.random() < 0.9)
+    shape = rng.random()
+    if shape < 0.5:
+        return number
+    if shape < 0.8:
+        return " ".join(number[i : i + 4] for i in range(0, 16, 4))
+    return "-".join(number[i : i + 4] for i in range(0, 16, 4))
+
+
+def _raw_phone(rng):
+    digits = f"99890{rng.randrange(10**7):07d}"
+    shape = rng.random()
+    if shape < 0.4:
+        return digits
+    if shape < 0.7:
+        return f"+{digits[:3]} ({digits[3:5]}) {digits[5:8]}-{digits[8:10]}-{digits[10:]}"
+    if shape < 0.9:
+        return f"{digits[3:5]} {digits[5:8]} {digits[8:10]} {digits[10:]}"
+    return ""
+
+
+def _raw_expire(rng):
+    year = rng.randrange(2024, 2036)
+    month = rng.randrange(1, 13)
+    return rng.choice([f"{year}-{month:02d}", f"{month:02d}/{year % 100:02d}", f"{month}/{year}", f"{year}.{month}"])
+
+
+def _amount(rng):
+    return Decimal(rng.randrange(0, 10**10)) / 100
+
+
+def _raw_balance(rng):
+    amount = _amount(rng)
+    return rng.choice([f"{amount:,.2f}", f"{amount:.2f}", str(int(amount)), "", "n/a"])
+
+
+def _xlsx_file(rng):
+    rows = [["card_number", "expire", "phone", "status", "balance"]]
+    for _ in range(XLSX_ROWS):
+        rows.append([_raw_card(rng), _raw_expire(rng), _raw_phone(rng), "active", _raw_balance(rng)])
+    return build_simple_xlsx(rows)
+
+
+BENCHMARKS = {
+    "format_card": (format_card, lambda rng: (_raw_card(rng),)),
+    "format_phone": (format_phone, lambda rng: (_raw_phone(rng),)),
+    "normalize_expire": (normalize_expire, lambda rng: (_raw_expire(rng),)),
+    "card_mask": (card_mask, lambda rng: (_card_number(rng),)),
+    "validate_card": (validate_card, lambda rng: (_raw_card(rng),)),
+    "parse_balance": (parse_balance, lambda rng: (_raw_balance(rng),)),
+    "prepare_message": (prepare_message, lambda rng: (_card_number(rng), f"{_amount(rng):.2f}")),
+    "read_simple_xlsx": (lambda data: read_simple_xlsx(io.BytesIO(data)), lambda rng: (_xlsx_file(rng),)),
+}
+# Workbooks are XLSX_ROWS rows each, so far fewer calls give a comparable timing.
+SIZE_DIVISORS = {"read_simple_xlsx": XLSX_ROWS}
+
+
+def check_cases(names=None):
+    failures = []
+    for name in names or CASES:
+        func = BENCHMARKS[name][0]
+        for args, expected in CASES.get(name, []):
+            actual = func(*args)
+            if actual != expected:
+                failures.append((name, args, expected, actual))
+    return failures
+
+
+def generate_inputs(name, size, seed=0):
+    make_args = BENCHMARKS[name][1]
+    rng = random.Random(f"{seed}:{name}")
+    count = max(1, size // SIZE_DIVISORS.get(name, 1))
+    return [make_args(rng) for _ in range(count)]
+
+
+def time_helper(func, inputs, repeat=7):
+    best = None
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter_ns()
+            for args in inputs:
+                func(*args)
+            elapsed = time.perf_counter_ns() - started
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best / len(inputs)
+
+
+def run_benchmarks(names=None, size=10_000, repeat=7, seed=0):
+    results = {}
+    for name in names or BENCHMARKS:
+        inputs = generate_inputs(name, size, seed)
+        results[name] = time_helper(BENCHMARKS[name][0], inputs, repeat)
+    return results
+
+
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous and current > previous * threshold:
+            regressions.append((name, previous, current, current / previous))
+    return regressions
@@ -0,0 +1,208 @@
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from .models import Card, Transfer
+from .sharding import atomic_on
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MAX_BATCH": 100,
+}
+
+
+class _Operation:
+    __slots__ = ("payload", "event", "finished", "result", "error")
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.event = threading.Event()
+        self.finished = False
+        self.result = None
+        self.error = None
+
+
+class LeaderAborted(Exception):
+    pass
+
+
+class CardWriteQueue:
+    def __init__(self, execute, max_batch=100):
+        self.execute = execute
+        self.max_batch = max_batch
+        self.batches = 0
+        self.operations = 0
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def submit(self, key, payload):
+        operation = _Operation(payload)
+        with self._lock:
+            leading = key not in self._pending
+            self._pending.setdefault(key, deque()).append(operation)
+        if not leading:
+            operation.event.wait()
+        if not operation.finished:
+            # First caller for an idle card, or handed the card by the previous leader.
+            self._lead(key, operation)
+        if operation.error is not None:
+            raise operation.error
+        return operation.result
+
+    def _lead(self, key, own):
+        served = False
+        try:
+            while not own.finished:
+                with self._lock:
+                    queue = self._pending[key]
+                    batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch))]
+                self._run(batch)
+            served = True
+        finally:
+            with self._lock:
+                queue = self._pending[key]
+                if served and queue:
+                    # Hand over as soon as our own operation is done; the next caller leads the rest.
+                    queue[0].event.set()
+                    queue = ()
+                else:
+                    del self._pending[key]
+            for operation in queue:
+                # Something like KeyboardInterrupt stopped this leader; nobody else would wake these callers.
+                operation.error = LeaderAborted("The card write leader stopped before this operation ran")
+                operation.finished = True
+                operation.event.set()
+
+    def _run(self, batch):
+        try:
+            results = self.execute([operation.payload for operation in batch])
+        except Exception as exc:
+            for operation in batch:
+                operation.error = exc
+        except BaseException:
+            for operation in batch:
+                operation.error = LeaderAborted("The card write leader stopped while running this operation")
+            raise
+        else:
+            for operation, result in zip(batch, results):
+                operation.result = result
+        finally:
+            with self._lock:
+                self.batches += 1
+                self.operations += len(batch)
+            for operation in batch:
+                operation.finished = True
+                operation.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {"batches": self.batches, "operations": self.operations, "queued_cards": len(self._pending)}
+
+
+class ConfirmConflict(Exception):
+    pass
+
+
+def settle_each(transfers, all_or_nothing=False):
+    card_numbers = {transfer.sender_card_number for transfer in transfers}
+    card_numbers |= {transfer.receiver_card_number for transfer in transfers}
+    cards = {
+        card.card_number: card
+        for card in Card.objects.select_for_update().filter(card_number__in=card_numbers).order_by("card_number")
+    }
+    balances = {card_number: card.balance for card_number, card in cards.items()}
+    codes = []
+    for transfer in transfers:
+        sender, receiver = transfer.sender_card_number, transfer.receiver_card_number
+        if sender not in cards or receiver not in cards:
+            codes.append(32706)
+        elif balances[sender] < transfer.sending_amount:
+            codes.append(32702)
+        else:
+            balances[sender] -= transfer.sending_amount
+            balances[receiver] += transfer.receiving_amount
+            codes.append(None)
+    if all_or_nothing and any(codes):
+        return codes
+    for card_number, card in cards.items():
+        if balances[card_number] != card.balance:
+            card.balance = balances[card_number]
+            card.save(update_fields=["balance"])
+    return codes
+
+
+def confirm_transfers(transfers, all_or_nothing=False):
+    keys = [(transfer._state.db or DEFAULT_DB_ALIAS, transfer.pk) for transfer in transfers]
+    first_index = {}
+    shards = {}
+    for index, (alias, pk) in enumerate(keys):
+        first_index.setdefault((alias, pk), index)
+        shards.setdefault(alias, set()).add(pk)
+    results = [32706] * len(transfers)
+    confirmed = []
+    now = timezone.now()
+    try:
+        # Cards commit last: a failure between the two commits leaves a confirmed
+        # transfer without balance movement, which reconciliation can detect.
+        with transaction.atomic(), atomic_on(shards):
+            states = {}
+            for alias, pks in shards.items():
+                rows = list(
+                    Transfer.objects.using(alias).select_for_update().filter(pk__in=pks).values_list("pk", "state")
+                )
+                states.update(((alias, pk), state) for pk, state in rows)
+            live = [index for key, index in first_index.items() if states.get(key) == Transfer.STATE_CREATED]
+            if all_or_nothing and len(live) != len(first_index):
+                return results
+            for key, index in first_index.items():
+                if states.get(key) == Transfer.STATE_CONFIRMED:
+                    results[index] = None
+            codes = settle_each([transfers[index] for index in live], all_or_nothing)
+            if all_or_nothing and any(codes):
+                return [next(code for code in codes if code)] * len(transfers)
+            for index, code in zip(live, codes):
+                results[index] = code
+                if code is None:
+                    confirmed.append(transfers[index])
+            for alias in shards:
+                pks = [transfer.pk for transfer in confirmed if (transfer._state.db or DEFAULT_DB_ALIAS) == alias]
+                if not pks:
+                    continue
+                updated = Transfer.objects.using(alias).filter(pk__in=pks, state=Transfer.STATE_CREATED).update(
+                    state=Transfer.STATE_CONFIRMED, confirmed_at=now, updated_at=now
+                )
+                if updated != len(pks):
+                    # Someone changed a transfer despite the lock; roll the balances back with it.
+                    raise ConfirmConflict()
+    except ConfirmConflict:
+        return [32706] * len(transfers)
+    for transfer in confirmed:
+        transfer.state = Transfer.STATE_CONFIRMED
+        transfer.confirmed_at = now
+    # A transfer submitted twice in one batch shares the outcome of its first copy.
+    return [results[first_index[key]] for key in keys]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_card_write_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                config = {**DEFAULTS, **getattr(settings, "CARD_WRITE_QUEUE", {})}
+                _queue = CardWriteQueue(confirm_transfers, config["MAX_BATCH"]) if config["ENABLED"] else False
+    return _queue or None
+
+
+def confirm_transfer(transfer, queue=None):
+    queue = queue or get_card_write_queue()
+    if queue is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        # Inside a caller's transaction a batch would commit with (or roll back alongside) someone else's work.
+        return confirm_transfers([transfer])[0]
+    return queue.submit(transfer.sender_card_number, transfer)
@@ -0,0 +1,156 @@
+import os
+import socket
+import zipfile
+from datetime import timedelta
+from xml.etree import ElementTree
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Card, CardImportJob
+from .reconcile import net_movements
+from .utils import format_card, format_phone, normalize_expire, parse_balance, read_simple_xlsx
+
+IMPORT_COLUMNS = ["card_number", "expire", "phone", "status", "balance"]
+MAX_STORED_ERRORS = 1_000
+
+
+def check_header(rows):
+    if not rows:
+        return "Excel file is empty."
+    header = [cell.strip().lower() for cell in rows[0]]
+    if header[: len(IMPORT_COLUMNS)] != IMPORT_COLUMNS:
+        return f"Invalid header. Expected: {', '.join(IMPORT_COLUMNS)}"
+    return None
+
+
+def parse_card_row(row):
+    data = dict(zip(IMPORT_COLUMNS, row))
+    values = {
+        "card_number": format_card(data.get("card_number"), digits_only=True),
+        "expire": normalize_expire(data.get("expire")),
+        "phone": format_phone(data.get("phone"), digits_only=True),
+        "status": str(data.get("status", "")).strip().lower(),
+        "balance": parse_balance(data.get("balance")),
+    }
+
+    errors = []
+    if len(values["card_number"]) != 16:
+        errors.append("card_number must be 16 digits")
+    if not values["expire"] or len(values["expire"]) != 7:
+        errors.append("expire must be in YYYY-MM")
+    if values["phone"] and len(values["phone"]) not in {9, 12}:
+        errors.append("phone must be 9 or 12 digits")
+    if values["status"] not in dict(Card.STATUS_CHOICES):
+        errors.append("status must be active, inactive, or expired")
+    if values["balance"] is None:
+        errors.append("balance must be numeric")
+    return values, errors
+
+
+def import_card_rows(rows, first_row_number=2):
+    parsed = []
+    errors = []
+    for row_number, row in enumerate(rows, start=first_row_number):
+        if not any(row):
+            continue
+        values, row_errors = parse_card_row(row)
+        if row_errors:
+            errors.append(f"Row {row_number}: {', '.join(row_errors)}")
+        else:
+            parsed.append(values)
+
+    card_numbers = list({values["card_number"] for values in parsed})
+    existing = {card.card_number: card for card in Card.objects.filter(card_number__in=card_numbers)}
+    net = net_movements(card_numbers)
+    for values in parsed:
+        card = existing.get(values["card_number"]) or Card()
+        for field, value in values.items():
+            setattr(card, field, value)
+        # The imported balance is authoritative, so reconciliation starts again from it.
+        card.opening_balance = values["balance"] - net[values["card_number"]]
+        # Saved one by one so the summary table and updated_at stay in step.
+        card.save()
+        existing[card.card_number] = card
+    return len(parsed), errors
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(worker, stale_after=60.0):
+    stale = timezone.now() - timedelta(seconds=stale_after)
+    candidates = (
+        CardImportJob.objects.filter(
+            Q(status=CardImportJob.STATUS_PENDING) | Q(status=CardImportJob.STATUS_RUNNING, heartbeat_at__lt=stale)
+        )
+        .order_by("pk")
+        .values_list("pk", "status", "heartbeat_at")[:10]
+    )
+    for pk, status, heartbeat_at in candidates:
+        # Compare-and-set on the values just read, so two workers never claim the same job.
+        claimed = CardImportJob.objects.filter(pk=pk, status=status, heartbeat_at=heartbeat_at).update(
+            status=CardImportJob.STATUS_RUNNING, worker=worker, heartbeat_at=timezone.now(), failure=""
+        )
+        if claimed:
+            return CardImportJob.objects.get(pk=pk)
+    return None
+
+
+def discard_upload(job):
+    # The name stays on the job for the record; the spreadsheet itself is gone once the job is settled.
+    if job.file.name:
+        job.file.storage.delete(job.file.name)
+
+
+def _read_rows(job):
+    with job.file.open("rb") as handle:
+        return read_simple_xlsx(handle)
+
+
+def run_job(job, worker, chunk_size=500):
+    try:
+        rows = _read_rows(job)
+    except (OSError, KeyError, zipfile.BadZipFile, ElementTree.ParseError) as exc:
+        return fail_job(job, worker, f"Cannot read {job.original_name}: {exc}")
+    failure = check_header(rows)
+    if failure:
+        return fail_job(job, worker, failure)
+    data_rows = rows[1:]
+    CardImportJob.objects.filter(pk=job.pk, worker=worker).update(total_rows=len(data_rows))
+
+    while True:
+        with transaction.atomic():
+            locked = CardImportJob.objects.select_for_update().get(pk=job.pk)
+            if locked.worker != worker or locked.status != CardImportJob.STATUS_RUNNING:
+                return None
+            start = locked.processed_rows
+            now = timezone.now()
+            if start >= len(data_rows):
+                locked.status = CardImportJob.STATUS_DONE
+                locked.heartbeat_at = now
+                locked.finished_at = now
+                locked.save(update_fields=["status", "heartbeat_at", "finished_at"])
+                transaction.on_commit(lambda: discard_upload(locked))
+                return locked
+            chunk = data_rows[start : start + chunk_size]
+            imported, errors = import_card_rows(chunk, first_row_number=start + 2)
+            # The checkpoint commits with the chunk, so a crash resumes right after the last full chunk.
+            locked.processed_rows = start + len(chunk)
+            locked.imported_count += imported
+            locked.error_count += len(errors)
+            locked.errors = (locked.errors + errors)[:MAX_STORED_ERRORS]
+            locked.heartbeat_at = now
+            locked.save(update_fields=["processed_rows", "imported_count", "error_count", "errors", "heartbeat_at"])
+
+
+def fail_job(job, worker, failure):
+    CardImportJob.objects.filter(pk=job.pk, worker=worker).update(
+        status=CardImportJob.STATUS_FAILED, failure=failure, finished_at=timezone.now()
+    )
+    job.refresh_from_db()
+    if job.status == CardImportJob.STATUS_FAILED:
+        discard_upload(job)
+    return job
@@ -0,0 +1,101 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from .utils import card_mask
+
+STRUCTURED_FIELDS = ("event", "method", "ext_id", "duration_ms", "suppressed")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        card = getattr(record, "card", None)
+        if card:
+            payload["card"] = card_mask(card)
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates=None, exception_limit=10, exception_window=60.0):
+        super().__init__()
+        self.rates = rates or {}
+        self.exception_limit = exception_limit
+        self.exception_window = exception_window
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        rate = self.rates.get(getattr(record, "event", None), 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return False
+        if not record.exc_info or not self.exception_limit:
+            return True
+        key = (record.name, record.msg, record.exc_info[0])
+        now = time.monotonic()
+        with self._lock:
+            started, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - started >= self.exception_window:
+                started, count = now, 0
+            if count >= self.exception_limit:
+                self._windows[key] = (started, count, suppressed + 1)
+                return False
+            self._windows[key] = (started, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class BackgroundQueueHandler(QueueHandler):
+    def __init__(self, target=None, queue_size=10_000):
+        super().__init__(queue.Queue(queue_size))
+        self.target = target or logging.StreamHandler()
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.listener = None
+        self._start()
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self._restart)
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+
+    def _restart(self):
+        # The listener thread does not survive fork; workers need their own.
+        self.queue = queue.Queue(self.queue_size)
+        self._start()
+
+    def stop(self):
+        if self.listener and self.listener._thread:
+            self.listener.stop()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not the request thread.
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
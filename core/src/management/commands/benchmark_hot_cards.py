@@ -0,0 +1,152 @@
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Sum
+
+from src.cardqueue import CardWriteQueue, confirm_transfer, confirm_transfers
+from src.models import Card, Transfer
+from src.sharding import group_by_shard
+
+AMOUNT = Decimal("0.01")
+
+
+def pick_pairs(cards, count, hot_cards, hot_share, rng):
+    hot, cold = cards[:hot_cards], cards[hot_cards:] or cards
+    pairs = []
+    for _ in range(count):
+        sender = rng.choice(hot) if hot and rng.random() < hot_share else rng.choice(cold)
+        receiver = rng.choice(cards)
+        while receiver == sender:
+            receiver = rng.choice(cards)
+        pairs.append((sender, receiver))
+    return pairs
+
+
+def create_transfers(mode, pairs):
+    run = uuid.uuid4().hex[:8]
+    transfers = [
+        Transfer(
+            ext_id=f"bench-{mode}-{run}-{index}",
+            sender_card_number=sender[0],
+            sender_card_expiry=sender[1],
+            receiver_card_number=receiver[0],
+            sending_amount=AMOUNT,
+            receiving_amount=AMOUNT,
+            currency=860,
+        )
+        for index, (sender, receiver) in enumerate(pairs)
+    ]
+    for alias, shard_transfers in group_by_shard(transfers, key=lambda transfer: transfer.ext_id).items():
+        Transfer.objects.using(alias).bulk_create(shard_transfers, batch_size=1_000)
+    loaded = {}
+    for alias, shard_transfers in group_by_shard(transfers, key=lambda transfer: transfer.ext_id).items():
+        stored = Transfer.objects.using(alias).filter(ext_id__in=[transfer.ext_id for transfer in shard_transfers])
+        loaded.update((transfer.ext_id, transfer) for transfer in stored)
+    return [loaded[transfer.ext_id] for transfer in transfers]
+
+
+class Command(BaseCommand):
+    help = (
+        "Confirm transfers concurrently with a few hot sender cards, with and without the per-card write queue. "
+        "Moves money between existing cards and keeps the bench- transfers; run it on a load-test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transfers", type=int, default=2_000, help="Transfers confirmed per mode.")
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--hot-cards", type=int, default=2)
+        parser.add_argument("--hot-share", type=float, default=0.8, help="Share of transfers sent from hot cards.")
+        parser.add_argument("--max-batch", type=int, default=100)
+        parser.add_argument("--mode", choices=["direct", "queued", "both"], default="both")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        cards = list(
+            Card.objects.filter(status="active", balance__gte=AMOUNT * options["transfers"])
+            .order_by("-balance")
+            .values_list("card_number", "expire")[:1_000]
+        )
+        if len(cards) < 2:
+            raise CommandError("Need at least two active cards with enough balance; run seed_cards first.")
+        rng = random.Random(options["seed"])
+        pairs = pick_pairs(cards, max(1, options["transfers"]), options["hot_cards"], options["hot_share"], rng)
+        modes = ["direct", "queued"] if options["mode"] == "both" else [options["mode"]]
+
+        for mode in modes:
+            queue = CardWriteQueue(confirm_transfers, max(1, options["max_batch"])) if mode == "queued" else None
+            transfers = create_transfers(mode, pairs)
+            card_numbers = {card_number for pair in pairs for card_number, _ in pair}
+            total_before = Card.objects.filter(card_number__in=card_numbers).aggregate(total=Sum("balance"))["total"]
+            outcomes, latencies, elapsed = self._run(mode, transfers, queue, max(1, options["threads"]))
+            total_after = Card.objects.filter(card_number__in=card_numbers).aggregate(total=Sum("balance"))["total"]
+            # SQLite sums decimals as floats.
+            moved = Decimal(total_after - total_before).quantize(AMOUNT) + 0
+
+            confirmed = sum(
+                Transfer.objects.using(alias)
+                .filter(pk__in=[transfer.pk for transfer in shard_transfers], state=Transfer.STATE_CONFIRMED)
+                .count()
+                for alias, shard_transfers in group_by_shard(transfers, key=lambda transfer: transfer.ext_id).items()
+            )
+            aborted = sum(count for outcome, count in outcomes.items() if outcome not in {"ok", "32702"})
+            latencies.sort()
+            self.stdout.write(
+                f"{mode:<7} {len(transfers) / elapsed:>9.1f} confirms/s  "
+                f"aborted {aborted / len(transfers):6.1%}  rejected {outcomes['32702']}  "
+                f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms  "
+                f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms"
+            )
+            for outcome, count in sorted(outcomes.items()):
+                if outcome != "ok":
+                    self.stdout.write(f"        {count:>6}  {outcome}")
+            if queue is not None:
+                stats = queue.stats()
+                self.stdout.write(f"        {stats['operations'] / max(1, stats['batches']):.1f} confirms per batch")
+            # Same-currency transfers only move money between the sampled cards, so their total must not change.
+            consistent = outcomes["ok"] == confirmed and not moved
+            style = self.style.SUCCESS if consistent else self.style.ERROR
+            self.stdout.write(
+                style(f"        {confirmed} confirmed, total balance changed by {moved}")
+            )
+
+    def _run(self, mode, transfers, queue, thread_count):
+        outcomes = Counter()
+        latencies = []
+        lock = threading.Lock()
+        pending = iter(transfers)
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        transfer = next(pending, None)
+                    if transfer is None:
+                        return
+                    started = time.perf_counter()
+                    try:
+                        if queue is None:
+                            code = confirm_transfers([transfer])[0]
+                        else:
+                            code = confirm_transfer(transfer, queue=queue)
+                        outcome = "ok" if code is None else str(code)
+                    except Exception as exc:
+                        outcome = f"{type(exc).__name__}: {exc}"
+                    with lock:
+                        outcomes[outcome] += 1
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, name=f"{mode}-{index}") for index in range(thread_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes, latencies, time.perf_counter() - started
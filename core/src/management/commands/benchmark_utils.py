@@ -0,0 +1,64 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.benchmarks import BENCHMARKS, check_cases, find_regressions, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Check and time the src.utils helpers, comparing against stored baseline timings."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help="Helpers to run; defaults to all.")
+        parser.add_argument("--size", type=int, default=10_000, help="Generated inputs per helper.")
+        parser.add_argument("--repeat", type=int, default=7, help="Timed passes; the fastest one is kept.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--baseline",
+            default=os.path.join(settings.BASE_DIR, "benchmarks", "utils_baseline.json"),
+            help="Relative paths resolve against BASE_DIR.",
+        )
+        parser.add_argument("--threshold", type=float, default=1.5, help="Fail when a helper is this much slower.")
+        parser.add_argument("--save-baseline", action="store_true")
+
+    def handle(self, *args, **options):
+        names = options["names"] or list(BENCHMARKS)
+        unknown = sorted(set(names) - set(BENCHMARKS))
+        if unknown:
+            raise CommandError(f"Unknown helpers: {', '.join(unknown)}")
+        failures = check_cases(names)
+        for name, call_args, expected, actual in failures:
+            self.stderr.write(f"{name}{call_args!r}: expected {expected!r}, got {actual!r}")
+        if failures:
+            raise CommandError(f"{len(failures)} correctness cases failed")
+
+        size = max(1, options["size"])
+        results = run_benchmarks(names, size=size, repeat=max(1, options["repeat"]), seed=options["seed"])
+        path = os.path.join(settings.BASE_DIR, options["baseline"])
+        baseline = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as handle:
+                baseline = json.load(handle)["results"]
+        elif not options["save_baseline"]:
+            raise CommandError(f"No baseline at {path}; record one with --save-baseline.")
+
+        for name, current in results.items():
+            previous = baseline.get(name)
+            change = f"{current / previous:6.2f}x" if previous else "      -"
+            self.stdout.write(f"{name:<18} {current:>12,.0f} ns/call  {change}")
+
+        if options["save_baseline"]:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump({"size": size, "results": {**baseline, **results}}, handle, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {path}"))
+            return
+
+        regressions = find_regressions(results, baseline, options["threshold"])
+        for name, previous, current, ratio in regressions:
+            self.stderr.write(f"{name} regressed: {previous:,.0f} -> {current:,.0f} ns/call ({ratio:.2f}x)")
+        if regressions:
+            raise CommandError(f"{len(regressions)} helpers regressed past {options['threshold']}x")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} helpers within {options['threshold']}x of baseline"))
@@ -1,19 +1,45 @@
 import csv
+import os
+from datetime import datetime, timedelta
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
 
-from src.models import Card
+from src.models import Card, CardTombstone
 from src.utils import format_card, format_phone
 
 
 class Command(BaseCommand):
-    help = "Export cards to CSV with optional filtering."
+    help = (
+        "Export cards to CSV with optional filtering, or only the cards changed since a watermark. "
+        "Delta rows are idempotent upserts/deletes, with deleted cards first so replaying the file in order "
+        "keeps a card that was deleted and re-created. Each run re-exports the --overlap window before the "
+        "watermark, so a transaction that commits up to lag + overlap seconds after stamping updated_at is "
+        "still picked up; anything slower needs a full export. Delta runs also purge tombstones older than "
+        "CARD_TOMBSTONE_RETENTION_DAYS."
+    )
 
     def add_arguments(self, parser):
         parser.add_argument("--status", choices=[choice[0] for choice in Card.STATUS_CHOICES])
         parser.add_argument("--card-number")
         parser.add_argument("--phone")
         parser.add_argument("--output", default="cards_export.csv")
+        parser.add_argument("--since", help="Export only cards changed after this ISO timestamp.")
+        parser.add_argument("--watermark-file", help="Read --since from and write the new watermark to this file.")
+        parser.add_argument("--tombstones", action="store_true", help="Include cards deleted since the watermark.")
+        parser.add_argument(
+            "--lag",
+            type=float,
+            default=5.0,
+            help="Seconds to stay behind now, so rows from transactions still committing are not skipped.",
+        )
+        parser.add_argument(
+            "--overlap",
+            type=float,
+            default=300.0,
+            help="Seconds before the watermark to export again, for rows committed after an earlier run.",
+        )
 
     def handle(self, *args, **options):
         queryset = Card.objects.all()
@@ -22,25 +48,84 @@ class Command(BaseCommand):
         phone = options.get("phone")
         output = options["output"]
 
+        changed = queryset
         if status:
             queryset = queryset.filter(status=status)
         if card_number:
             queryset = queryset.filter(card_number__icontains=card_number.replace(" ", ""))
         if phone:
             queryset = queryset.filter(phone__icontains=phone.replace(" ", ""))
+        filtered = bool(status or card_number or phone)
 
+        watermark_file = options.get("watermark_file")
+        since = options.get("since")
+        if not since and watermark_file and os.path.exists(watermark_file):
+            with open(watermark_file, encoding="utf-8") as handle:
+                since = handle.read().strip()
+        delta = bool(since or watermark_file)
+
+        tombstones = CardTombstone.objects.none()
+        left_filter = Card.objects.none()
+        if delta:
+            now = timezone.now()
+            until = now - timedelta(seconds=options["lag"])
+            retention = timedelta(days=settings.CARD_TOMBSTONE_RETENTION_DAYS)
+            queryset = queryset.filter(updated_at__lte=until).order_by("updated_at")
+            changed = changed.filter(updated_at__lte=until)
+            if options["tombstones"]:
+                tombstones = CardTombstone.objects.filter(deleted_at__lte=until).order_by("deleted_at", "pk")
+            if since:
+                since = self._parse_watermark(since)
+                if options["tombstones"] and since < now - retention:
+                    raise CommandError(
+                        f"Watermark {since.isoformat()} is older than the tombstone retention; run a full export."
+                    )
+                since -= timedelta(seconds=options["overlap"])
+                queryset = queryset.filter(updated_at__gt=since)
+                changed = changed.filter(updated_at__gt=since)
+                tombstones = tombstones.filter(deleted_at__gt=since)
+            if filtered and options["tombstones"]:
+                # Cards that changed so they no longer match the filters leave the export like deleted ones.
+                left_filter = changed.exclude(pk__in=queryset.values("pk")).order_by("updated_at")
+            CardTombstone.objects.filter(deleted_at__lt=now - retention).delete()
+
+        count = 0
         with open(output, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.writer(csvfile)
-            writer.writerow(["card_number", "expire", "phone", "status", "balance"])
-            for card in queryset:
-                writer.writerow(
-                    [
-                        format_card(card.card_number),
-                        card.expire,
-                        format_phone(card.phone),
-                        card.status,
-                        f"{card.balance:.2f}",
-                    ]
-                )
-
-        self.stdout.write(self.style.SUCCESS(f"Exported {queryset.count()} cards to {output}"))
+            header = ["card_number", "expire", "phone", "status", "balance"]
+            writer.writerow(header + ["op"] if delta else header)
+            # Tombstones go first: a card deleted and re-created in the window must end up as an upsert.
+            for tombstone in tombstones.iterator(chunk_size=5_000):
+                writer.writerow([format_card(tombstone.card_number), "", "", "", "", "delete"])
+                count += 1
+            for card in queryset.iterator(chunk_size=5_000):
+                row = [
+                    format_card(card.card_number),
+                    card.expire,
+                    format_phone(card.phone),
+                    card.status,
+                    f"{card.balance:.2f}",
+                ]
+                writer.writerow(row + ["upsert"] if delta else row)
+                count += 1
+            for card_number in left_filter.values_list("card_number", flat=True).iterator(chunk_size=5_000):
+                writer.writerow([format_card(card_number), "", "", "", "", "delete"])
+                count += 1
+
+        if delta:
+            watermark = until.isoformat()
+            with open(watermark_file or f"{output}.watermark", "w", encoding="utf-8") as handle:
+                handle.write(watermark)
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} changes to {output}; watermark {watermark}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Exported {count} cards to {output}"))
+
+    @staticmethod
+    def _parse_watermark(value):
+        try:
+            watermark = datetime.fromisoformat(value)
+        except ValueError as exc:
+            raise CommandError(f"Invalid watermark: {value}") from exc
+        if timezone.is_naive(watermark):
+            watermark = timezone.make_aware(watermark)
+        return watermark
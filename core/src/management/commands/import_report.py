@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.warmup import warm_up
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+def parse_importtime(output):
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        fields = line[len(IMPORT_TIME_PREFIX) :].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(fields[0]), int(fields[1])))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Report import times for a cold worker start and fail when they exceed the budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--module", default="core.wsgi", help="Module a fresh worker imports.")
+        parser.add_argument("--budget-ms", type=float, default=None, help="Defaults to settings.IMPORT_TIME_BUDGET_MS.")
+        parser.add_argument("--runs", type=int, default=3, help="Cold imports to run; the fastest one is reported.")
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--warmup", action="store_true", help="Also time the worker warm-up steps.")
+
+    def handle(self, *args, **options):
+        budget = options["budget_ms"] or getattr(settings, "IMPORT_TIME_BUDGET_MS", None)
+        runs = [self._measure(options["module"]) for _ in range(max(1, options["runs"]))]
+        modules = min(runs, key=lambda run: sum(cumulative for _, depth, _, cumulative in run if depth == 0))
+        total_ms = sum(cumulative for _, depth, _, cumulative in modules if depth == 0) / 1000
+
+        packages = defaultdict(int)
+        for name, _, own, _ in modules:
+            packages[name.split(".")[0]] += own
+        self.stdout.write(f"Slowest packages (self time), {len(modules)} modules imported:")
+        for package, own in sorted(packages.items(), key=lambda item: -item[1])[: options["top"]]:
+            self.stdout.write(f"  {own / 1000:>9.1f} ms  {package}")
+        self.stdout.write("Slowest modules (cumulative):")
+        for name, _, _, cumulative in sorted(modules, key=lambda module: -module[3])[: options["top"]]:
+            self.stdout.write(f"  {cumulative / 1000:>9.1f} ms  {name}")
+
+        if options["warmup"]:
+            self.stdout.write("Warm-up steps:")
+            for name, (duration, result) in warm_up().items():
+                self.stdout.write(f"  {duration:>9.1f} ms  {name} ({result})")
+
+        message = f"Importing {options['module']} took {total_ms:.1f} ms"
+        if budget and total_ms > budget:
+            raise CommandError(f"{message}, over the {budget:.0f} ms budget")
+        suffix = f" (budget {budget:.0f} ms)" if budget else ""
+        self.stdout.write(self.style.SUCCESS(message + suffix))
+
+    def _measure(self, module):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", "core.settings")}
+        completed = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode:
+            errors = [line for line in completed.stderr.splitlines() if not line.startswith(IMPORT_TIME_PREFIX)]
+            raise CommandError(f"Importing {module} failed:\n" + "\n".join(errors[-20:]))
+        return parse_importtime(completed.stderr)
@@ -28,6 +28,12 @@ class Command(BaseCommand):
             (32712, "OTP is wrong, left try count is 2", "Неверный OTP, осталось 2 попытки", "Noto‘g‘ri OTP, yana 2 urinish qoldi"),
             (32713, "Method is not allowed", "Метод не разрешён", "Usulga ruxsat berilmagan"),
             (32714, "Method not found", "Метод не найден", "Usul topilmadi"),
+            (
+                32715,
+                "Service is overloaded, retry later",
+                "Сервис перегружен, повторите позже",
+                "Xizmat band, keyinroq urinib ko‘ring",
+            ),
         ]
 
         created = 0
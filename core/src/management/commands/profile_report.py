@@ -0,0 +1,43 @@
+import pstats
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from src.profiling import DEFAULTS, profile_token
+
+
+class Command(BaseCommand):
+    help = "Merge and summarize sampled JSON-RPC profiles per method."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir")
+        parser.add_argument("--method")
+        parser.add_argument("--sort", default="cumulative")
+        parser.add_argument("--limit", type=int, default=25)
+        parser.add_argument("--output", help="Write the merged stats for --method to this .prof file.")
+        parser.add_argument("--token", action="store_true", help="Print a signed X-RPC-Profile header value.")
+
+    def handle(self, *args, **options):
+        if options["token"]:
+            self.stdout.write(profile_token())
+            return
+        config = {**DEFAULTS, **getattr(settings, "RPC_PROFILING", {})}
+        directory = Path(options["dir"] or config["DIR"])
+        files = defaultdict(list)
+        for path in sorted(directory.glob("*.prof")):
+            files[path.name.split("-", 1)[0]].append(path)
+        if options["method"]:
+            files = {options["method"]: files.get(options["method"], [])}
+        if not any(files.values()):
+            raise CommandError(f"No profiles found in {directory}.")
+
+        for method, paths in sorted(files.items()):
+            if not paths:
+                continue
+            stats = pstats.Stats(*map(str, paths), stream=self.stdout)
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{method}: {len(paths)} profiles"))
+            if options["output"] and options["method"]:
+                stats.dump_stats(options["output"])
+            stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["limit"])
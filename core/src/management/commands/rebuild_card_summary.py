@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from src.parallel import map_chunks
+from src.summary import aggregate_range, card_pk_ranges, merge_partials, replace_summary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the card status/balance summary table from scratch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--chunk-size", type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        ranges = card_pk_ranges(max(1, options["chunk_size"]))
+        totals = merge_partials(map_chunks(aggregate_range, ranges, workers=options["workers"]))
+        replace_summary(totals)
+        cards = sum(card_count for card_count, _ in totals.values())
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt summary for {cards} cards over {len(ranges)} ranges.")
+        )
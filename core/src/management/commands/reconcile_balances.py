@@ -0,0 +1,90 @@
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from src.parallel import map_chunks
+from src.reconcile import apply_baseline, baseline_range, reconcile_range
+from src.summary import card_pk_ranges
+from src.utils import format_card
+
+
+class Command(BaseCommand):
+    help = "Check card balances against confirmed transfers and report the cards that do not match."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--chunk-size", type=int, default=10_000)
+        parser.add_argument("--output", default="balance_discrepancies.csv")
+        parser.add_argument("--checkpoint", help="Defaults to <output>.checkpoint.")
+        parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint.")
+        parser.add_argument(
+            "--rebaseline",
+            action="store_true",
+            help="Set opening balances so current balances reconcile; run once after loading existing data.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+        workers = options["workers"]
+        if options["rebaseline"]:
+            ranges = card_pk_ranges(chunk_size)
+            # Workers compute the baselines; writes stay in this process so they do not contend.
+            cards = sum(apply_baseline(rows) for rows in map_chunks(baseline_range, ranges, workers=workers))
+            self.stdout.write(self.style.SUCCESS(f"Rebaselined {cards} cards over {len(ranges)} ranges."))
+            return
+
+        output = options["output"]
+        checkpoint = options["checkpoint"] or f"{output}.checkpoint"
+        ranges, done = None, {}
+        if os.path.exists(checkpoint) and not options["restart"]:
+            ranges, done = self._load_checkpoint(checkpoint)
+        resuming = ranges is not None
+        if not resuming:
+            ranges = card_pk_ranges(chunk_size)
+            with open(checkpoint, "w", encoding="utf-8") as handle:
+                handle.write(json.dumps({"ranges": ranges}) + "\n")
+        pending = [pk_range for pk_range in ranges if pk_range not in done]
+
+        checked = sum(count for count, _ in done.values())
+        found = sum(count for _, count in done.values())
+        with open(output, "a" if resuming else "w", newline="", encoding="utf-8") as csvfile, open(
+            checkpoint, "a", encoding="utf-8"
+        ) as progress:
+            writer = csv.writer(csvfile)
+            if not resuming:
+                writer.writerow(["card_number", "balance", "expected", "difference"])
+            for pk_range, count, mismatched in map_chunks(reconcile_range, pending, workers=workers):
+                writer.writerows(
+                    [format_card(card_number), f"{balance:.2f}", f"{expected:.2f}", f"{balance - expected:.2f}"]
+                    for card_number, balance, expected in mismatched
+                )
+                csvfile.flush()
+                progress.write(json.dumps({"range": list(pk_range), "checked": count, "found": len(mismatched)}) + "\n")
+                progress.flush()
+                checked += count
+                found += len(mismatched)
+
+        os.remove(checkpoint)
+        skipped = f", {len(ranges) - len(pending)} ranges resumed" if resuming else ""
+        message = f"Checked {checked} cards over {len(ranges)} ranges{skipped}: {found} discrepancies in {output}"
+        self.stdout.write(self.style.SUCCESS(message) if not found else self.style.WARNING(message))
+
+    @staticmethod
+    def _load_checkpoint(path):
+        with open(path, encoding="utf-8") as handle:
+            lines = [line for line in handle.read().splitlines() if line.strip()]
+        try:
+            ranges = [tuple(pk_range) for pk_range in json.loads(lines[0])["ranges"]]
+        except (IndexError, KeyError, ValueError) as exc:
+            raise CommandError(f"Invalid checkpoint {path}; rerun with --restart") from exc
+        done = {}
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A run killed mid-write leaves a partial line; that range is simply checked again.
+                continue
+            done[tuple(entry["range"])] = (entry["checked"], entry["found"])
+        return ranges, done
@@ -0,0 +1,76 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from src.models import Transfer, keep_transfer_timestamps
+from src.sharding import group_by_shard, shard_for, transfer_shards
+
+COPIED_FIELDS = [field.name for field in Transfer._meta.concrete_fields if field.name not in {"id", "ext_id"}]
+
+
+class Command(BaseCommand):
+    help = (
+        "Move Transfer rows onto the shard their ext_id hashes to under the current "
+        "TRANSFER_SHARDS. Old aliases to drain must still be listed in DATABASES. "
+        "Each batch is locked on its source while it is copied and deleted, and the "
+        "source copy wins over any copy a crashed earlier run left on the target."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", action="append", default=[], help="Extra database alias to drain.")
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--migrate", action="store_true", help="Run migrate on every shard first.")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        shards = transfer_shards()
+        sources = list(dict.fromkeys([DEFAULT_DB_ALIAS, *shards, *options["source"]]))
+        unknown = [alias for alias in sources if alias not in connections.databases]
+        if unknown:
+            raise CommandError(f"Unknown database aliases: {', '.join(unknown)}")
+
+        if options["migrate"]:
+            for alias in shards:
+                call_command("migrate", database=alias, verbosity=0)
+
+        moved = 0
+        for source in sources:
+            moved += self._drain(source, shards, options["batch_size"], options["dry_run"])
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {moved} transfers across {len(shards)} shards."))
+
+    def _drain(self, source, shards, batch_size, dry_run):
+        moved = 0
+        last_pk = 0
+        while True:
+            rows = list(Transfer.objects.using(source).filter(pk__gt=last_pk).order_by("pk")[:batch_size])
+            if not rows:
+                return moved
+            last_pk = rows[-1].pk
+            misplaced = [row for row in rows if shard_for(row.ext_id, shards) != source]
+            moved += len(misplaced)
+            if dry_run or not misplaced:
+                continue
+            with transaction.atomic(using=source):
+                # Re-read under the lock: confirms, cancels and retries on these rows wait until they are
+                # deleted here, so nothing written to the source after the copy is lost.
+                locked = list(
+                    Transfer.objects.using(source).select_for_update().filter(pk__in=[row.pk for row in misplaced])
+                )
+                pks = [row.pk for row in locked]
+                # The target commits first; a crash before the delete leaves both copies, and a rerun overwrites
+                # the target's with the source's.
+                for target, transfers in group_by_shard(locked, key=lambda transfer: transfer.ext_id).items():
+                    copies = [self._detach(transfer) for transfer in transfers]
+                    with transaction.atomic(using=target), keep_transfer_timestamps():
+                        Transfer.objects.using(target).bulk_create(
+                            copies, update_conflicts=True, unique_fields=["ext_id"], update_fields=COPIED_FIELDS
+                        )
+                Transfer.objects.using(source).filter(pk__in=pks).delete()
+
+    @staticmethod
+    def _detach(transfer):
+        transfer.pk = None
+        transfer._state.db = None
+        transfer._state.adding = True
+        return transfer
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from src.summary import last_closed_day, rollup_closed_days
+
+
+class Command(BaseCommand):
+    help = "Roll up transfer counts and sums for closed days."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true")
+
+    def handle(self, *args, **options):
+        created = rollup_closed_days(rebuild=options["rebuild"])
+        self.stdout.write(
+            self.style.SUCCESS(f"Wrote {created} rollup rows through {last_closed_day().isoformat()}.")
+        )
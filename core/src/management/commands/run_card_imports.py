@@ -0,0 +1,64 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from src.imports import claim_job, fail_job, run_job, worker_name
+
+logger = logging.getLogger(__name__)
+
+# A chunk commits its heartbeat only when it finishes, so the takeover timeout has to cover the slowest chunk.
+STALE_SECONDS_PER_ROW = 0.2
+
+
+class Command(BaseCommand):
+    help = "Process queued Excel card imports; run several to import several files in parallel."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=500, help="Rows committed per checkpoint.")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds to sleep when no job is queued.")
+        parser.add_argument(
+            "--stale-after",
+            type=float,
+            default=120.0,
+            help=(
+                "Seconds without a checkpoint before a running job is taken over by another worker; "
+                f"raised to {STALE_SECONDS_PER_ROW}s per row of --chunk-size for large chunks."
+            ),
+        )
+        parser.add_argument("--once", action="store_true", help="Exit when no job is left instead of polling.")
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        chunk_size = max(1, options["chunk_size"])
+        stale_after = max(options["stale_after"], chunk_size * STALE_SECONDS_PER_ROW)
+        processed = 0
+        while True:
+            close_old_connections()
+            job = claim_job(worker, stale_after)
+            if job is None:
+                if options["once"]:
+                    break
+                time.sleep(options["poll"])
+                continue
+
+            self.stdout.write(f"{worker} importing {job.original_name} from row {job.processed_rows + 2}")
+            try:
+                job = run_job(job, worker, chunk_size=chunk_size)
+            except Exception as exc:
+                logger.exception("card import %s failed", job.pk, extra={"event": "card_import_failed"})
+                job = fail_job(job, worker, f"{type(exc).__name__}: {exc}")
+            if job is None:
+                self.stdout.write(self.style.WARNING(f"{worker} lost its job to another worker"))
+                continue
+            processed += 1
+            style = self.style.SUCCESS if job.status == job.STATUS_DONE else self.style.ERROR
+            self.stdout.write(
+                style(
+                    f"{job.original_name}: {job.status}, {job.imported_count} imported, {job.error_count} row errors"
+                    + (f" ({job.failure})" if job.failure else "")
+                )
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} import jobs."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from src.stub_gateway import StubGatewayServer
+
+
+class Command(BaseCommand):
+    help = "Run a local notification gateway stub for tests and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8025)
+        parser.add_argument("--fail-rate", type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        server = StubGatewayServer((options["host"], options["port"]), fail_rate=options["fail_rate"])
+        self.stdout.write(self.style.SUCCESS(f"Stub gateway listening on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stats: {server.stats}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from src.models import Card
+from src.parallel import map_chunks, split_range
+from src.seeding import seed_cards_chunk
+from src.summary import add_to_summary, merge_partials
+
+
+class Command(BaseCommand):
+    help = "Generate Luhn-valid cards in bulk for local load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--offset", type=int, help="First card index; defaults to the current card count.")
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--chunk-size", type=int, default=50_000)
+        parser.add_argument("--workers", type=int, default=1)
+
+    def handle(self, *args, **options):
+        offset = options["offset"] if options["offset"] is not None else Card.objects.count()
+        jobs = [
+            (start, stop, options["seed"], options["batch_size"])
+            for start, stop in split_range(offset, offset + options["count"], max(1, options["chunk_size"]))
+        ]
+        totals = merge_partials(map_chunks(seed_cards_chunk, jobs, workers=options["workers"]))
+        add_to_summary(totals)
+        created = sum(card_count for card_count, _ in totals.values())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {created} cards."))
@@ -0,0 +1,58 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from src.models import Card, Transfer
+from src.parallel import map_chunks, split_range
+from src.seeding import load_seed_cards, seed_transfers_chunk, shift_opening_balances
+from src.sharding import fan_out
+
+
+class Command(BaseCommand):
+    help = "Generate transfer history with a few hot cards for local load testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1_000_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--offset", type=int, help="First transfer index; defaults to the current transfer count.")
+        parser.add_argument("--days", type=int, default=90)
+        parser.add_argument("--hot-cards", type=int, default=20)
+        parser.add_argument("--hot-share", type=float, default=0.3)
+        parser.add_argument("--batch-size", type=int, default=5_000)
+        parser.add_argument("--chunk-size", type=int, default=50_000)
+        parser.add_argument("--workers", type=int, default=1)
+
+    def handle(self, *args, **options):
+        cards = list(Card.objects.order_by("pk").values_list("card_number", "expire"))
+        if not cards:
+            raise CommandError("No cards to transfer between; run seed_cards first.")
+        offset = options["offset"]
+        if offset is None:
+            offset = sum(fan_out(lambda alias: Transfer.objects.using(alias).count()))
+        jobs = [
+            (
+                start,
+                stop,
+                options["seed"],
+                options["batch_size"],
+                max(1, options["days"]),
+                min(options["hot_cards"], len(cards)),
+                options["hot_share"],
+            )
+            for start, stop in split_range(offset, offset + options["count"], max(1, options["chunk_size"]))
+        ]
+        created = 0
+        net = defaultdict(Decimal)
+        for count, chunk_net in map_chunks(
+            seed_transfers_chunk,
+            jobs,
+            workers=options["workers"],
+            initializer=load_seed_cards,
+            initargs=(cards,),
+        ):
+            created += count
+            for card_number, amount in chunk_net.items():
+                net[card_number] += amount
+        shift_opening_balances(net)
+        self.stdout.write(self.style.SUCCESS(f"Seeded {created} transfers."))
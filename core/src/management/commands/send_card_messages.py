@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 
 from src.models import Card
-from src.utils import prepare_message, send_message
+from src.notifier import get_notifier
+from src.utils import prepare_message
 
 
 class Command(BaseCommand):
@@ -27,10 +28,10 @@ class Command(BaseCommand):
         if phone:
             queryset = queryset.filter(phone__icontains=phone.replace(" ", ""))
 
-        count = 0
-        for card in queryset:
-            message = prepare_message(card.card_number, card.balance)
-            send_message(message, chat_id=chat_id)
-            count += 1
+        messages = (
+            (chat_id, prepare_message(card_number, balance))
+            for card_number, balance in queryset.values_list("card_number", "balance").iterator()
+        )
+        count = get_notifier().send_many("chat", messages)
 
         self.stdout.write(self.style.SUCCESS(f"Sent {count} messages."))
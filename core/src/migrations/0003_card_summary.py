@@ -0,0 +1,74 @@
+from django.db import migrations, models
+from django.db.models import Case, CharField, Count, Sum, Value, When
+
+from src.utils import BALANCE_LOW_LIMIT, BALANCE_MID_LIMIT
+
+
+def populate_summary(apps, schema_editor):
+    Card = apps.get_model("src", "Card")
+    CardSummary = apps.get_model("src", "CardSummary")
+    db_alias = schema_editor.connection.alias
+    bucket = Case(
+        When(balance__lte=0, then=Value("zero")),
+        When(balance__lte=BALANCE_LOW_LIMIT, then=Value("low")),
+        When(balance__lte=BALANCE_MID_LIMIT, then=Value("mid")),
+        default=Value("high"),
+        output_field=CharField(),
+    )
+    rows = (
+        Card.objects.using(db_alias)
+        .annotate(bucket=bucket)
+        .order_by()
+        .values("status", "bucket")
+        .annotate(card_count=Count("pk"), total_balance=Sum("balance"))
+    )
+    CardSummary.objects.using(db_alias).bulk_create(
+        [
+            CardSummary(
+                status=row["status"],
+                bucket=row["bucket"],
+                card_count=row["card_count"],
+                total_balance=row["total_balance"] or 0,
+            )
+            for row in rows
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("src", "0002_transfer_and_error"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CardSummary",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("active", "Active"), ("inactive", "Inactive"), ("expired", "Expired")],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.CharField(
+                        choices=[
+                            ("zero", "0"),
+                            ("low", "0 - 10,000"),
+                            ("mid", "10,000 - 1,000,000"),
+                            ("high", "1,000,000+"),
+                        ],
+                        max_length=4,
+                    ),
+                ),
+                ("card_count", models.BigIntegerField(default=0)),
+                ("total_balance", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={"ordering": ["status", "bucket"], "unique_together": {("status", "bucket")}},
+        ),
+        migrations.RunPython(populate_summary, migrations.RunPython.noop),
+    ]
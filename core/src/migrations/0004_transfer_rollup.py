@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("src", "0003_card_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TransferDailyRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField(db_index=True)),
+                ("currency", models.PositiveSmallIntegerField()),
+                ("state", models.CharField(choices=[("created", "Created"), ("confirmed", "Confirmed"), ("cancelled", "Cancelled")], max_length=10)),
+                ("transfer_count", models.BigIntegerField(default=0)),
+                ("sending_amount", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("receiving_amount", models.DecimalField(decimal_places=2, default=0, max_digits=24)),
+            ],
+            options={
+                "ordering": ["day", "currency", "state"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="transfer",
+            index=models.Index(fields=["created_at"], name="src_transfe_created_c8863f_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="transfer",
+            index=models.Index(fields=["sender_card_number", "created_at"], name="src_transfe_sender__c8605c_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="transfer",
+            index=models.Index(fields=["receiver_card_number", "created_at"], name="src_transfe_receive_1d4322_idx"),
+        ),
+        migrations.AlterUniqueTogether(
+            name="transferdailyrollup",
+            unique_together={("day", "currency", "state")},
+        ),
+    ]
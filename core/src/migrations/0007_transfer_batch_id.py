@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("src", "0006_card_tombstone"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transfer",
+            name="batch_id",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("src", "0007_transfer_batch_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="card",
+            name="opening_balance",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+    ]
@@ -0,0 +1,40 @@
+import re
+
+from django.db import migrations
+from django.db.models.functions import Now
+
+# A copy of src.utils.normalize_expire as of this migration, so later changes there do not alter it.
+EXPIRE_YEAR_FIRST_RE = re.compile(r"(?P<year>\d{4})[-./](?P<month>\d{1,2})")
+EXPIRE_MONTH_FIRST_RE = re.compile(r"(?P<month>\d{1,2})[-./](?P<year>\d{2,4})")
+
+
+def normalize_expire(raw_expire):
+    value = str(raw_expire).strip()
+    match = EXPIRE_YEAR_FIRST_RE.fullmatch(value) or EXPIRE_MONTH_FIRST_RE.fullmatch(value)
+    if not match:
+        return value
+    year = match.group("year")
+    if len(year) == 2:
+        year = f"20{year}"
+    return f"{year}-{int(match.group('month')):02d}"
+
+
+def normalize_card_expire(apps, schema_editor):
+    Card = apps.get_model("src", "Card")
+    db_alias = schema_editor.connection.alias
+    cards = Card.objects.using(db_alias).exclude(expire__regex=r"^[0-9]{4}-[0-9]{2}$").exclude(expire="")
+    for pk, expire in cards.values_list("pk", "expire").iterator():
+        normalized = normalize_expire(expire)
+        if normalized != expire:
+            # Bumping updated_at lets delta exports and the card directory pick the change up.
+            Card.objects.using(db_alias).filter(pk=pk).update(expire=normalized, updated_at=Now())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("src", "0008_card_opening_balance"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_card_expire, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, migrations
+from django.db.models import Sum
+
+CENT = Decimal("0.01")
+
+
+def backfill_opening_balance(apps, schema_editor):
+    Card = apps.get_model("src", "Card")
+    Transfer = apps.get_model("src", "Transfer")
+    db_alias = schema_editor.connection.alias
+    net = defaultdict(Decimal)
+    for alias in getattr(settings, "TRANSFER_SHARDS", None) or [db_alias]:
+        if Transfer._meta.db_table not in connections[alias].introspection.table_names():
+            # A fresh install migrates default before the shards, which cannot hold transfers yet.
+            continue
+        confirmed = Transfer.objects.using(alias).filter(state="confirmed").order_by()
+        for row in confirmed.values("sender_card_number").annotate(total=Sum("sending_amount")):
+            net[row["sender_card_number"]] -= Decimal(str(row["total"])).quantize(CENT)
+        for row in confirmed.values("receiver_card_number").annotate(total=Sum("receiving_amount")):
+            net[row["receiver_card_number"]] += Decimal(str(row["total"])).quantize(CENT)
+
+    # Cards existed before opening_balance did, so their baseline is today's balance less confirmed transfers.
+    changed = []
+    cards = Card.objects.using(db_alias).only("pk", "card_number", "balance", "opening_balance")
+    for card in cards.iterator(chunk_size=2_000):
+        opening_balance = Decimal(str(card.balance)).quantize(CENT) - net[card.card_number]
+        if opening_balance != card.opening_balance:
+            card.opening_balance = opening_balance
+            changed.append(card)
+        if len(changed) >= 2_000:
+            Card.objects.using(db_alias).bulk_update(changed, ["opening_balance"])
+            changed = []
+    if changed:
+        Card.objects.using(db_alias).bulk_update(changed, ["opening_balance"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("src", "0010_card_import_job"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_opening_balance, migrations.RunPython.noop),
+    ]
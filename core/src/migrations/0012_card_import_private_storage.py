@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 05:28
+
+import os
+import shutil
+
+import src.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+def move_uploads_out_of_media(apps, schema_editor):
+    CardImportJob = apps.get_model("src", "CardImportJob")
+    jobs = CardImportJob.objects.using(schema_editor.connection.alias).exclude(file="")
+    for name in jobs.values_list("file", flat=True).iterator():
+        # Names are kept, so the storage finds the moved file under CARD_IMPORT_ROOT.
+        source = os.path.join(settings.MEDIA_ROOT, name)
+        if os.path.isfile(source):
+            target = os.path.join(settings.CARD_IMPORT_ROOT, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(source, target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('src', '0011_backfill_opening_balance'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cardimportjob',
+            name='file',
+            field=models.FileField(storage=src.models.CardImportStorage(), upload_to='%Y/%m/'),
+        ),
+        migrations.RunPython(move_uploads_out_of_media, migrations.RunPython.noop),
+    ]
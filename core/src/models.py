@@ -1,6 +1,16 @@
-from django.db import models
+import os
+from contextlib import contextmanager
+from decimal import Decimal
 
-from .utils import format_card, format_phone, normalize_expire
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .utils import BALANCE_BUCKET_CHOICES, balance_bucket, format_card, format_phone, normalize_expire
 
 
 class Card(models.Model):
@@ -19,6 +29,8 @@ class Card(models.Model):
     phone = models.CharField(max_length=15, blank=True, db_index=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
     balance = models.DecimalField(max_digits=15, decimal_places=2)
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["card_number"]
@@ -30,7 +42,17 @@ class Card(models.Model):
         self.card_number = format_card(self.card_number, digits_only=True)
         self.phone = format_phone(self.phone, digits_only=True)
         self.expire = normalize_expire(self.expire)
-        super().save(*args, **kwargs)
+        if self._state.adding and not self.opening_balance:
+            self.opening_balance = self.balance
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "updated_at"}
+        with transaction.atomic():
+            previous = None
+            if self.pk:
+                # Locked so concurrent saves apply their summary deltas one after another.
+                previous = Card.objects.select_for_update().filter(pk=self.pk).values_list("status", "balance").first()
+            super().save(*args, **kwargs)
+            CardSummary.record_change(previous, (self.status, Decimal(str(self.balance))))
 
     @property
     def card_number_readable(self):
@@ -41,6 +63,121 @@ class Card(models.Model):
         return format_phone(self.phone)
 
 
+@receiver(post_delete, sender=Card)
+def _card_deleted(sender, instance, **kwargs):
+    CardSummary.record_change((instance.status, instance.balance), None)
+    CardTombstone.objects.create(card_number=instance.card_number)
+
+
+class CardTombstone(models.Model):
+    card_number = models.CharField(max_length=16)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ["deleted_at"]
+
+    def __str__(self):
+        return f"{format_card(self.card_number)} deleted at {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class CardImportStorage(FileSystemStorage):
+    # Uploads hold card numbers and balances, so they live outside the publicly served MEDIA_ROOT.
+    @property
+    def base_location(self):
+        return settings.CARD_IMPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
+
+
+class CardImportJob(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    file = models.FileField(upload_to="%Y/%m/", storage=CardImportStorage())
+    original_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    imported_count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    failure = models.TextField(blank=True)
+    worker = models.CharField(max_length=255, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.original_name} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return 100 if self.status == self.STATUS_DONE else 0
+        return min(100, self.processed_rows * 100 // self.total_rows)
+
+
+class CardSummary(models.Model):
+    status = models.CharField(max_length=10, choices=Card.STATUS_CHOICES)
+    bucket = models.CharField(max_length=4, choices=BALANCE_BUCKET_CHOICES)
+    card_count = models.BigIntegerField(default=0)
+    total_balance = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["status", "bucket"]
+        unique_together = [("status", "bucket")]
+
+    def __str__(self):
+        return f"{self.status}/{self.bucket}: {self.card_count}"
+
+    @classmethod
+    def record_change(cls, previous, current):
+        if previous == current:
+            return
+        deltas = {}
+        for state, sign in ((previous, -1), (current, 1)):
+            if state is None:
+                continue
+            status, balance = state
+            key = (status, balance_bucket(balance))
+            count, total = deltas.get(key, (0, Decimal("0")))
+            deltas[key] = (count + sign, total + sign * balance)
+        for (status, bucket), (count, total) in deltas.items():
+            if count or total:
+                cls._bump(status, bucket, count, total)
+
+    @classmethod
+    def _bump(cls, status, bucket, count, total):
+        rows = cls.objects.filter(status=status, bucket=bucket)
+        changes = {
+            "card_count": F("card_count") + count,
+            "total_balance": F("total_balance") + total,
+            "updated_at": timezone.now(),
+        }
+        if not rows.update(**changes):
+            cls.objects.get_or_create(status=status, bucket=bucket)
+            rows.update(**changes)
+
+
 class Transfer(models.Model):
     STATE_CREATED = "created"
     STATE_CONFIRMED = "confirmed"
@@ -53,6 +190,7 @@ class Transfer(models.Model):
     ]
 
     ext_id = models.CharField(max_length=64, unique=True, db_index=True)
+    batch_id = models.CharField(max_length=64, blank=True, db_index=True)
     sender_card_number = models.CharField(max_length=16)
     receiver_card_number = models.CharField(max_length=16)
     sender_card_expiry = models.CharField(max_length=7)
@@ -71,11 +209,44 @@ class Transfer(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["sender_card_number", "created_at"]),
+            models.Index(fields=["receiver_card_number", "created_at"]),
+        ]
 
     def __str__(self):
         return f"{self.ext_id} ({self.state})"
 
 
+@contextmanager
+def keep_transfer_timestamps():
+    # Lets bulk loads write their own created_at/updated_at values.
+    created_at = Transfer._meta.get_field("created_at")
+    updated_at = Transfer._meta.get_field("updated_at")
+    created_at.auto_now_add = updated_at.auto_now = False
+    try:
+        yield
+    finally:
+        created_at.auto_now_add = updated_at.auto_now = True
+
+
+class TransferDailyRollup(models.Model):
+    day = models.DateField(db_index=True)
+    currency = models.PositiveSmallIntegerField()
+    state = models.CharField(max_length=10, choices=Transfer.STATE_CHOICES)
+    transfer_count = models.BigIntegerField(default=0)
+    sending_amount = models.DecimalField(max_digits=20, decimal_places=2, default=0)
+    receiving_amount = models.DecimalField(max_digits=24, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["day", "currency", "state"]
+        unique_together = [("day", "currency", "state")]
+
+    def __str__(self):
+        return f"{self.day} {self.currency} {self.state}: {self.transfer_count}"
+
+
 class Error(models.Model):
     code = models.PositiveIntegerField(unique=True)
     en = models.CharField(max_length=255)
@@ -0,0 +1,310 @@
+import http.client
+import json
+import logging
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "GATEWAY_URL": "",
+    "POOL_SIZE": 4,
+    "TIMEOUT": 2.0,
+    "RETRIES": 3,
+    "DEADLINE": 3.0,
+    "BACKOFF": 0.1,
+    "RATE": 30.0,
+    "BURST": 30,
+    "MAX_WAIT": 1.0,
+    "MAX_BUCKETS": 10_000,
+    "BATCH_SIZE": 100,
+    "FAILURE_THRESHOLD": 5,
+    "RESET_TIMEOUT": 30.0,
+}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class NotifierError(Exception):
+    pass
+
+
+class RetryableError(NotifierError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, url, size=4, timeout=2.0):
+        parts = urlsplit(url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip("/")
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self.connection_class(self.host, self.port, timeout=self.timeout)
+
+    def _release(self, connection):
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def post_json(self, path, payload, timeout=None):
+        connection = self._acquire()
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        timeout = self.timeout if timeout is None else min(self.timeout, timeout)
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        else:
+            connection.timeout = timeout
+        try:
+            connection.request(
+                "POST", self.path + path, body=body, headers={"Content-Type": "application/json"}
+            )
+            response = connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            connection.close()
+            raise RetryableError(str(exc)) from exc
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+        if response.status in RETRYABLE_STATUSES:
+            raise RetryableError(f"gateway returned {response.status}")
+        if response.status >= 400:
+            raise NotifierError(f"gateway returned {response.status}")
+        try:
+            return json.loads(data or b"{}")
+        except ValueError as exc:
+            raise NotifierError(f"gateway returned an invalid body: {exc}") from exc
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=0.0):
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half-open: let one request probe the gateway.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LoggingNotifier:
+    def send(self, channel, destination, text):
+        logger.info("Sending %s to %s: %s", channel, destination, text, extra={"event": "notify"})
+        return True
+
+    def send_many(self, channel, messages):
+        sent = 0
+        for destination, text in messages:
+            sent += self.send(channel, destination, text)
+        return sent
+
+    def close(self):
+        pass
+
+
+class HttpNotifier:
+    def __init__(
+        self,
+        gateway_url,
+        pool_size=4,
+        timeout=2.0,
+        retries=3,
+        deadline=3.0,
+        backoff=0.1,
+        rate=30.0,
+        burst=30,
+        max_wait=1.0,
+        max_buckets=10_000,
+        batch_size=100,
+        failure_threshold=5,
+        reset_timeout=30.0,
+    ):
+        self.pool = ConnectionPool(gateway_url, size=pool_size, timeout=timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.retries = retries
+        self.deadline = deadline
+        self.backoff = backoff
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.max_buckets = max_buckets
+        self.batch_size = batch_size
+        self._buckets = OrderedDict()
+        self._buckets_lock = threading.Lock()
+
+    def _bucket(self, destination):
+        with self._buckets_lock:
+            bucket = self._buckets.get(destination)
+            if bucket is None:
+                bucket = self._buckets[destination] = TokenBucket(self.rate, self.burst)
+                # The least recently used destination has likely refilled its bucket, so forgetting it is harmless.
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(destination)
+            return bucket
+
+    def _throttle(self, destination):
+        if not self.rate:
+            return True
+        if self._bucket(destination).acquire(self.max_wait):
+            return True
+        logger.warning("Notifier rate limit hit for %s", destination, extra={"event": "notify_throttled"})
+        return False
+
+    def _post(self, path, payload):
+        if not self.breaker.allow():
+            raise NotifierError("circuit open")
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic() if deadline else None
+            if remaining is not None and remaining <= 0:
+                # The backoff sleep overshot the deadline; a non-positive socket timeout would raise ValueError.
+                self.breaker.record_failure()
+                raise RetryableError("deadline exceeded")
+            try:
+                result = self.pool.post_json(path, payload, timeout=remaining)
+            except RetryableError:
+                delay = random.uniform(0, self.backoff * 2**attempt)
+                if attempt == self.retries or (deadline and time.monotonic() + delay >= deadline):
+                    self.breaker.record_failure()
+                    raise
+                time.sleep(delay)
+            else:
+                self.breaker.record_success()
+                return result
+
+    def send(self, channel, destination, text):
+        if not self._throttle(destination):
+            return False
+        try:
+            self._post("/send", {"channel": channel, "to": str(destination), "text": text})
+        except NotifierError as exc:
+            logger.warning("Notifier send to %s failed: %s", destination, exc)
+            return False
+        return True
+
+    def send_many(self, channel, messages):
+        if self.batch_size <= 1:
+            return sum(self.send(channel, destination, text) for destination, text in messages)
+        sent = 0
+        batch = []
+        for destination, text in messages:
+            if self._throttle(destination):
+                batch.append({"channel": channel, "to": str(destination), "text": text})
+            if len(batch) >= self.batch_size:
+                sent += self._send_batch(batch)
+                batch = []
+        if batch:
+            sent += self._send_batch(batch)
+        return sent
+
+    def _send_batch(self, batch):
+        try:
+            self._post("/send-batch", {"messages": batch})
+        except NotifierError as exc:
+            logger.warning("Notifier batch of %s failed: %s", len(batch), exc)
+            return 0
+        return len(batch)
+
+    def close(self):
+        self.pool.close()
+
+
+_notifier = None
+_notifier_lock = threading.Lock()
+
+
+def build_notifier(config=None):
+    config = {**DEFAULTS, **(config or {})}
+    if not config["GATEWAY_URL"]:
+        return LoggingNotifier()
+    return HttpNotifier(
+        config["GATEWAY_URL"],
+        pool_size=config["POOL_SIZE"],
+        timeout=config["TIMEOUT"],
+        retries=config["RETRIES"],
+        deadline=config["DEADLINE"],
+        backoff=config["BACKOFF"],
+        rate=config["RATE"],
+        burst=config["BURST"],
+        max_wait=config["MAX_WAIT"],
+        max_buckets=config["MAX_BUCKETS"],
+        batch_size=config["BATCH_SIZE"],
+        failure_threshold=config["FAILURE_THRESHOLD"],
+        reset_timeout=config["RESET_TIMEOUT"],
+    )
+
+
+def get_notifier():
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                _notifier = build_notifier(getattr(settings, "NOTIFIER", None))
+    return _notifier
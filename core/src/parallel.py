@@ -0,0 +1,30 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import connections
+
+
+def _init_worker(initializer, initargs):
+    import django
+
+    django.setup()
+    connections.close_all()
+    if initializer:
+        initializer(*initargs)
+
+
+def map_chunks(func, chunks, workers=1, initializer=None, initargs=()):
+    if workers <= 1 or len(chunks) <= 1:
+        if initializer:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield func(chunk)
+        return
+    connections.close_all()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(initializer, initargs)
+    ) as pool:
+        yield from pool.map(func, chunks)
+
+
+def split_range(start, stop, chunk_size):
+    return [(low, min(low + chunk_size, stop)) for low in range(start, stop, chunk_size)]
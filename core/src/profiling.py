@@ -0,0 +1,156 @@
+import cProfile
+import json
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+
+DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.0,
+    "PROFILER": "cprofile",
+    "SAMPLER_INTERVAL": 0.001,
+    "DIR": "profiles",
+    "MAX_FILES": 500,
+    "HEADER": "HTTP_X_RPC_PROFILE",
+    "HEADER_MAX_AGE": 300,
+}
+SIGNER_SALT = "src.profiling"
+
+
+def profile_token():
+    return signing.TimestampSigner(salt=SIGNER_SALT).sign("profile")
+
+
+def _label(frame):
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+class StackSampler:
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.samples = {}
+        self._thread_id = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enable(self):
+        self._thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            if stack:
+                stack = tuple(reversed(stack))
+                self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def create_stats(self):
+        # Shape the samples like cProfile output so pstats can load and merge them.
+        stats = {}
+        for stack, count in self.samples.items():
+            elapsed = count * self.interval
+            seen = set()
+            for depth, label in enumerate(stack):
+                calls, _, own, cumulative, callers = stats.get(label, (0, 0, 0.0, 0.0, {}))
+                if depth == len(stack) - 1:
+                    own += elapsed
+                if label not in seen:
+                    cumulative += elapsed
+                    calls += count
+                    seen.add(label)
+                if depth:
+                    caller = stack[depth - 1]
+                    prev = callers.get(caller, (0, 0, 0.0, 0.0))
+                    callers[caller] = (prev[0] + count, prev[1] + count, prev[2], prev[3] + elapsed)
+                stats[label] = (calls, calls, own, cumulative, callers)
+        self.stats = stats
+
+
+def _method_name(body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return "invalid"
+    if isinstance(payload, list):
+        return "batch"
+    if isinstance(payload, dict) and isinstance(payload.get("method"), str):
+        return "".join(char if char.isalnum() or char == "_" else "_" for char in payload["method"])[:64]
+    return "invalid"
+
+
+class RpcProfilingMiddleware:
+    def __init__(self, get_response):
+        self.config = {**DEFAULTS, **getattr(settings, "RPC_PROFILING", {})}
+        if not self.config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.directory = Path(self.config["DIR"])
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._busy = threading.Lock()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from .views import jsonrpc_endpoint
+
+        if view_func is not jsonrpc_endpoint or request.method != "POST" or not self._wanted(request):
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        try:
+            if self.config["PROFILER"] == "sampler":
+                profiler = StackSampler(self.config["SAMPLER_INTERVAL"])
+            else:
+                profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+            finally:
+                profiler.disable()
+            self._write(profiler, _method_name(request.body))
+        finally:
+            self._busy.release()
+        return response
+
+    def _wanted(self, request):
+        token = request.META.get(self.config["HEADER"])
+        if token:
+            try:
+                signing.TimestampSigner(salt=SIGNER_SALT).unsign(token, max_age=self.config["HEADER_MAX_AGE"])
+                return True
+            except signing.BadSignature:
+                pass
+        return random.random() < self.config["SAMPLE_RATE"]
+
+    def _write(self, profiler, method):
+        if isinstance(profiler, StackSampler) and not profiler.samples:
+            return
+        path = self.directory / f"{method}-{time.time_ns()}-{os.getpid()}.prof"
+        pstats.Stats(profiler).dump_stats(path)
+        self._rotate()
+
+    def _rotate(self):
+        files = sorted(self.directory.glob("*.prof"), key=lambda path: path.stat().st_mtime)
+        for path in files[: max(0, len(files) - self.config["MAX_FILES"])]:
+            path.unlink(missing_ok=True)
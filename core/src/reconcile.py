@@ -0,0 +1,80 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import Card, Transfer
+from .sharding import transfer_shards
+
+LOOKUP_BATCH = 2_000
+CENT = Decimal("0.01")
+
+
+def net_movements(card_numbers):
+    net = defaultdict(Decimal)
+    for alias in transfer_shards():
+        confirmed = Transfer.objects.using(alias).filter(state=Transfer.STATE_CONFIRMED).order_by()
+        for start in range(0, len(card_numbers), LOOKUP_BATCH):
+            batch = card_numbers[start : start + LOOKUP_BATCH]
+            debits = (
+                confirmed.filter(sender_card_number__in=batch)
+                .values("sender_card_number")
+                .annotate(total=Sum("sending_amount"))
+            )
+            for row in debits:
+                net[row["sender_card_number"]] -= Decimal(str(row["total"])).quantize(CENT)
+            credits = (
+                confirmed.filter(receiver_card_number__in=batch)
+                .values("receiver_card_number")
+                .annotate(total=Sum("receiving_amount"))
+            )
+            for row in credits:
+                net[row["receiver_card_number"]] += Decimal(str(row["total"])).quantize(CENT)
+    return net
+
+
+def _cards(queryset):
+    return list(queryset.order_by("pk").values_list("card_number", "opening_balance", "balance"))
+
+
+def _discrepancies(cards):
+    net = net_movements([card_number for card_number, _, _ in cards])
+    return [
+        (card_number, balance, opening_balance + net[card_number])
+        for card_number, opening_balance, balance in cards
+        if balance != opening_balance + net[card_number]
+    ]
+
+
+def reconcile_range(pk_range):
+    start, stop = pk_range
+    cards = _cards(Card.objects.filter(pk__gte=start, pk__lt=stop))
+    mismatched = _discrepancies(cards)
+    if mismatched:
+        # Re-read once so transfers confirmed while the range was scanned are not reported.
+        card_numbers = [row[0] for row in mismatched]
+        mismatched = _discrepancies(
+            [
+                card
+                for start in range(0, len(card_numbers), LOOKUP_BATCH)
+                for card in _cards(Card.objects.filter(card_number__in=card_numbers[start : start + LOOKUP_BATCH]))
+            ]
+        )
+    return pk_range, len(cards), mismatched
+
+
+def baseline_range(pk_range):
+    start, stop = pk_range
+    cards = list(
+        Card.objects.filter(pk__gte=start, pk__lt=stop).order_by("pk").values_list("pk", "card_number", "balance")
+    )
+    net = net_movements([card_number for _, card_number, _ in cards])
+    return [(pk, balance - net[card_number]) for pk, card_number, balance in cards]
+
+
+def apply_baseline(rows):
+    cards = [Card(pk=pk, opening_balance=opening_balance) for pk, opening_balance in rows]
+    with transaction.atomic():
+        Card.objects.bulk_update(cards, ["opening_balance"], batch_size=LOOKUP_BATCH)
+    return len(cards)
@@ -0,0 +1,194 @@
+import json
+import logging
+import time
+from contextlib import nullcontext
+from inspect import Parameter, signature
+from typing import Any, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+MAX_BATCH_SIZE = 100
+
+METHODS = {}
+BATCH_METHODS = {}
+
+
+class Error(NamedTuple):
+    code: int
+    message: str
+    data: Any = None
+
+
+class MethodSignature:
+    __slots__ = ("names", "required", "allowed")
+
+    def __init__(self, func):
+        parameters = [
+            parameter
+            for parameter in signature(func).parameters.values()
+            if parameter.kind in (Parameter.POSITIONAL_OR_KEYWORD, Parameter.KEYWORD_ONLY)
+        ]
+        self.names = tuple(parameter.name for parameter in parameters)
+        self.required = frozenset(
+            parameter.name for parameter in parameters if parameter.default is Parameter.empty
+        )
+        self.allowed = frozenset(self.names)
+
+    def bind(self, params):
+        if params is None:
+            params = {}
+        if isinstance(params, list):
+            if len(params) > len(self.names):
+                return None
+            params = dict(zip(self.names, params))
+        elif not isinstance(params, dict):
+            return None
+        if not self.required.issubset(params) or not self.allowed.issuperset(params):
+            return None
+        return params
+
+
+def method(func=None, name=None):
+    def decorator(func):
+        METHODS[name or func.__name__] = (func, MethodSignature(func))
+        return func
+
+    return decorator(func) if callable(func) else decorator
+
+
+def batch(name):
+    def decorator(func):
+        BATCH_METHODS[name] = func
+        return func
+
+    return decorator
+
+
+def _error_response(code, message, request_id=None, data=None):
+    error = {"code": code, "message": message}
+    if data is not None:
+        error["data"] = data
+    return {"jsonrpc": "2.0", "error": error, "id": request_id}
+
+
+def _result_response(result, request_id):
+    if isinstance(result, Error):
+        return _error_response(result.code, result.message, request_id, result.data)
+    return {"jsonrpc": "2.0", "result": result, "id": request_id}
+
+
+def _prepare(request):
+    if (
+        not isinstance(request, dict)
+        or request.get("jsonrpc") != "2.0"
+        or not isinstance(request.get("method"), str)
+        or not isinstance(request.get("id", 0), (str, int, type(None)))
+        or isinstance(request.get("id"), bool)
+    ):
+        return None, _error_response(INVALID_REQUEST, "Invalid Request")
+    request_id = request.get("id")
+    entry = METHODS.get(request["method"])
+    if entry is None:
+        return None, _error_response(METHOD_NOT_FOUND, "Method not found", request_id, request["method"])
+    func, method_signature = entry
+    kwargs = method_signature.bind(request.get("params"))
+    if kwargs is None:
+        return None, _error_response(INVALID_PARAMS, "Invalid params", request_id)
+    return (request["method"], func, kwargs), None
+
+
+def _call(func, kwargs, request_id):
+    started = time.perf_counter()
+    try:
+        return _result_response(func(**kwargs), request_id)
+    except Exception:
+        logger.exception("rpc method %s failed", func.__name__, extra={"event": "rpc_error", "method": func.__name__})
+        return _error_response(INTERNAL_ERROR, "Internal error", request_id)
+    finally:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "rpc call",
+                extra={
+                    "event": "rpc_call",
+                    "method": func.__name__,
+                    "ext_id": kwargs.get("ext_id"),
+                    "card": kwargs.get("sender_card_number") or kwargs.get("card_number"),
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                },
+            )
+
+
+def _dispatch_batch(requests):
+    responses = [None] * len(requests)
+    grouped = {}
+    for index, request in enumerate(requests):
+        prepared, error = _prepare(request)
+        if error is not None:
+            responses[index] = error
+            continue
+        name, func, kwargs = prepared
+        if name in BATCH_METHODS:
+            grouped.setdefault(name, []).append((index, kwargs))
+        else:
+            responses[index] = _call(func, kwargs, request.get("id"))
+
+    for name, calls in grouped.items():
+        try:
+            results = BATCH_METHODS[name]([kwargs for _, kwargs in calls])
+        except Exception:
+            logger.exception("rpc batch %s failed", name, extra={"event": "rpc_error", "method": name})
+            results = [Error(INTERNAL_ERROR, "Internal error")] * len(calls)
+        for (index, _), result in zip(calls, results):
+            responses[index] = _result_response(result, requests[index].get("id"))
+
+    return [response for request, response in zip(requests, responses) if _wants_response(request, response)]
+
+
+def _wants_response(request, response):
+    if not isinstance(request, dict) or "id" in request:
+        return True
+    return response.get("error", {}).get("code") == INVALID_REQUEST
+
+
+def _method_names(payload):
+    requests = payload if isinstance(payload, list) else [payload]
+    return [
+        request["method"]
+        for request in requests
+        if isinstance(request, dict) and isinstance(request.get("method"), str)
+    ]
+
+
+def dispatch(body, admit=None):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return serialize(_error_response(PARSE_ERROR, "Parse error"))
+
+    with admit(_method_names(payload)) if admit else nullcontext():
+        return _dispatch_payload(payload)
+
+
+def _dispatch_payload(payload):
+    if isinstance(payload, list):
+        if not payload:
+            return serialize(_error_response(INVALID_REQUEST, "Invalid Request"))
+        if len(payload) > MAX_BATCH_SIZE:
+            return serialize(_error_response(INVALID_REQUEST, f"Batch larger than {MAX_BATCH_SIZE} calls"))
+        responses = _dispatch_batch(payload)
+        return serialize(responses) if responses else ""
+
+    prepared, response = _prepare(payload)
+    if prepared is not None:
+        _, func, kwargs = prepared
+        response = _call(func, kwargs, payload.get("id"))
+    return serialize(response) if _wants_response(payload, response) else ""
+
+
+def serialize(response):
+    return json.dumps(response, separators=(",", ":"), ensure_ascii=False, default=str)
@@ -0,0 +1,144 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import Card, Transfer, keep_transfer_timestamps
+from .sharding import group_by_shard
+from .summary import merge_partials
+from .utils import balance_bucket, calculate_exchange, luhn_check_digit
+
+CARD_PREFIXES = ("8600", "9860", "4532", "5614")
+PHONE_OPERATORS = ("90", "91", "93", "94", "95", "97", "98", "99", "33", "88")
+CARD_BODY_SPACE = 10**11
+# Odd and not divisible by 5, so multiplying by it permutes the body space.
+CARD_BODY_STEP = 7_919_000_017
+
+_seed_cards = []
+
+
+def _rng(seed, label, start):
+    return random.Random(f"{seed}:{label}:{start}")
+
+
+def seed_card_number(index):
+    prefix = CARD_PREFIXES[index % len(CARD_PREFIXES)]
+    body = (index * CARD_BODY_STEP) % CARD_BODY_SPACE
+    partial = f"{prefix}{body:011d}"
+    return partial + luhn_check_digit(partial)
+
+
+def seed_phone(rng):
+    return f"998{rng.choice(PHONE_OPERATORS)}{rng.randrange(10**7):07d}"
+
+
+def seed_expire(rng, today):
+    year = today.year + rng.randint(-1, 5)
+    return f"{year}-{rng.randint(1, 12):02d}"
+
+
+def seed_balance(rng):
+    if rng.random() < 0.08:
+        return Decimal("0.00")
+    return Decimal(str(round(min(rng.lognormvariate(11, 2.2), 10**12), 2)))
+
+
+def seed_cards_chunk(job):
+    start, stop, seed, batch_size = job
+    rng = _rng(seed, "cards", start)
+    today = timezone.localdate()
+    cards = []
+    for index in range(start, stop):
+        roll = rng.random()
+        status = Card.STATUS_ACTIVE if roll < 0.85 else Card.STATUS_INACTIVE if roll < 0.95 else Card.STATUS_EXPIRED
+        cards.append(
+            Card(
+                card_number=seed_card_number(index),
+                expire=seed_expire(rng, today),
+                phone=seed_phone(rng) if rng.random() < 0.9 else "",
+                status=status,
+                balance=seed_balance(rng),
+            )
+        )
+    for card in cards:
+        card.opening_balance = card.balance
+    Card.objects.bulk_create(cards, batch_size=batch_size)
+    totals = merge_partials([[(card.status, balance_bucket(card.balance), 1, card.balance) for card in cards]])
+    return [(status, bucket, card_count, total) for (status, bucket), (card_count, total) in totals.items()]
+
+
+def load_seed_cards(cards):
+    _seed_cards[:] = cards
+
+
+def _pick_card(rng, hot_cards, hot_share):
+    if hot_cards and rng.random() < hot_share:
+        return _seed_cards[(int(rng.paretovariate(1.2)) - 1) % hot_cards]
+    return rng.choice(_seed_cards)
+
+
+def seed_transfers_chunk(job):
+    start, stop, seed, batch_size, days, hot_cards, hot_share = job
+    rng = _rng(seed, "transfers", start)
+    now = timezone.now()
+    transfers = []
+    for index in range(start, stop):
+        sender, sender_expire = _pick_card(rng, hot_cards, hot_share)
+        receiver, _ = _pick_card(rng, hot_cards, hot_share)
+        if receiver == sender and len(_seed_cards) > 1:
+            receiver, _ = rng.choice(_seed_cards)
+        currency = 643 if rng.random() < 0.7 else 840
+        amount = Decimal(str(round(min(rng.lognormvariate(4, 1.3), 1_000_000), 2))) or Decimal("1.00")
+        created_at = now - timedelta(seconds=rng.randrange(days * 86400))
+        roll = rng.random()
+        if roll < 0.8:
+            state, confirmed_at, cancelled_at = Transfer.STATE_CONFIRMED, created_at + timedelta(seconds=40), None
+        elif roll < 0.93:
+            state, confirmed_at, cancelled_at = Transfer.STATE_CANCELLED, None, created_at + timedelta(seconds=90)
+        else:
+            state, confirmed_at, cancelled_at = Transfer.STATE_CREATED, None, None
+        transfers.append(
+            Transfer(
+                ext_id=f"seed-{seed}-{index}",
+                sender_card_number=sender,
+                receiver_card_number=receiver,
+                sender_card_expiry=sender_expire,
+                sender_phone=seed_phone(rng),
+                receiver_phone=seed_phone(rng),
+                sending_amount=amount,
+                currency=currency,
+                receiving_amount=calculate_exchange(amount, currency),
+                state=state,
+                otp=f"{rng.randrange(10**6):06d}",
+                created_at=created_at,
+                confirmed_at=confirmed_at,
+                cancelled_at=cancelled_at,
+                updated_at=confirmed_at or cancelled_at or created_at,
+            )
+        )
+    with keep_transfer_timestamps():
+        for alias, shard_transfers in group_by_shard(transfers, key=lambda transfer: transfer.ext_id).items():
+            Transfer.objects.using(alias).bulk_create(shard_transfers, batch_size=batch_size)
+    net = defaultdict(Decimal)
+    for transfer in transfers:
+        if transfer.state == Transfer.STATE_CONFIRMED:
+            net[transfer.sender_card_number] -= transfer.sending_amount
+            net[transfer.receiver_card_number] += transfer.receiving_amount
+    return len(transfers), dict(net)
+
+
+def shift_opening_balances(net, batch_size=2_000):
+    # Seeded balances stay as generated; opening balances absorb the seeded confirmed transfers,
+    # so reconcile_balances finds the seeded data consistent.
+    card_numbers = [card_number for card_number, amount in net.items() if amount]
+    for start in range(0, len(card_numbers), batch_size):
+        cards = list(
+            Card.objects.filter(card_number__in=card_numbers[start : start + batch_size]).only(
+                "pk", "card_number", "opening_balance"
+            )
+        )
+        for card in cards:
+            card.opening_balance -= net[card.card_number]
+        Card.objects.bulk_update(cards, ["opening_balance"], batch_size=batch_size)
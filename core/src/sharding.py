@@ -0,0 +1,105 @@
+import heapq
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+def transfer_shards():
+    return list(getattr(settings, "TRANSFER_SHARDS", None) or [DEFAULT_DB_ALIAS])
+
+
+def shard_for(ext_id, shards=None):
+    shards = shards or transfer_shards()
+    if len(shards) == 1:
+        return shards[0]
+    return shards[zlib.crc32(str(ext_id).encode()) % len(shards)]
+
+
+def transfers_for(ext_id):
+    from .models import Transfer
+
+    return Transfer.objects.using(shard_for(ext_id))
+
+
+def group_by_shard(items, key=None):
+    groups = {}
+    for item in items:
+        groups.setdefault(shard_for(key(item) if key else item), []).append(item)
+    return groups
+
+
+@contextmanager
+def atomic_on(aliases):
+    with ExitStack() as stack:
+        for alias in sorted(aliases):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+FAN_OUT_WORKERS = 16
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    # Threads do not survive a fork, so each worker process starts its own pool.
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=FAN_OUT_WORKERS, thread_name_prefix="fan-out")
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _on_shard(func, alias):
+    try:
+        return func(alias)
+    finally:
+        # Pool threads keep their connections between requests, subject to CONN_MAX_AGE like request threads.
+        connections[alias].close_if_unusable_or_obsolete()
+
+
+def fan_out(func, aliases=None):
+    aliases = aliases or transfer_shards()
+    if len(aliases) == 1:
+        return [func(aliases[0])]
+    return list(_get_executor().map(lambda alias: _on_shard(func, alias), aliases))
+
+
+def merge_sorted(partials, key, reverse=False):
+    if len(partials) == 1:
+        return partials[0]
+    return list(heapq.merge(*partials, key=key, reverse=reverse))
+
+
+# Reads and writes that carry an instance follow it; plain Transfer.objects
+# queries still go to 'default', so code that lists transfers must fan_out.
+class TransferShardRouter:
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints)
+
+    def _db_for(self, model, hints):
+        if model._meta.label != "src.Transfer":
+            return None
+        instance = hints.get("instance")
+        if instance is None:
+            return None
+        if instance._state.db:
+            return instance._state.db
+        return shard_for(instance.ext_id)
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db not in transfer_shards() or db == DEFAULT_DB_ALIAS:
+            return None
+        return app_label == "src" and model_name == "transfer"
@@ -0,0 +1,69 @@
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.record(connections=1)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.server.fail_rate and random.random() < self.server.fail_rate:
+            self._reply(503, {"ok": False})
+            return
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            self._reply(400, {"ok": False})
+            return
+        if self.path.endswith("/send-batch"):
+            accepted = len(payload.get("messages", []))
+            self.server.record(requests=1, messages=accepted, batches=1)
+        elif self.path.endswith("/send"):
+            accepted = 1
+            self.server.record(requests=1, messages=1)
+        else:
+            self._reply(404, {"ok": False})
+            return
+        self._reply(200, {"ok": True, "accepted": accepted})
+
+    def _reply(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), fail_rate=0.0):
+        super().__init__(address, StubGatewayHandler)
+        self.fail_rate = fail_rate
+        self.stats = {"connections": 0, "requests": 0, "messages": 0, "batches": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,208 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Max, Min, Q, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from .models import Card, CardSummary, Transfer, TransferDailyRollup
+from .parallel import split_range
+from .sharding import fan_out
+from .utils import BALANCE_LOW_LIMIT, BALANCE_MID_LIMIT, OTP_EXPIRY_MINUTES
+
+TRANSFER_PERIODS = {"day": TruncDate, "hour": TruncHour}
+
+
+def bucket_expression():
+    return Case(
+        When(balance__lte=0, then=Value("zero")),
+        When(balance__lte=BALANCE_LOW_LIMIT, then=Value("low")),
+        When(balance__lte=BALANCE_MID_LIMIT, then=Value("mid")),
+        default=Value("high"),
+        output_field=CharField(),
+    )
+
+
+def card_pk_ranges(chunk_size):
+    bounds = Card.objects.aggregate(low=Min("pk"), high=Max("pk"))
+    if bounds["low"] is None:
+        return []
+    return split_range(bounds["low"], bounds["high"] + 1, chunk_size)
+
+
+def aggregate_range(pk_range):
+    start, stop = pk_range
+    rows = (
+        Card.objects.filter(pk__gte=start, pk__lt=stop)
+        .annotate(bucket=bucket_expression())
+        .order_by()
+        .values("status", "bucket")
+        .annotate(card_count=Count("pk"), total_balance=Sum("balance"))
+    )
+    return [
+        (row["status"], row["bucket"], row["card_count"], Decimal(str(row["total_balance"] or 0)))
+        for row in rows
+    ]
+
+
+def merge_partials(partials):
+    totals = defaultdict(lambda: [0, Decimal("0")])
+    for partial in partials:
+        for status, bucket, card_count, total_balance in partial:
+            totals[(status, bucket)][0] += card_count
+            totals[(status, bucket)][1] += total_balance
+    return totals
+
+
+def add_to_summary(totals):
+    for (status, bucket), (card_count, total_balance) in totals.items():
+        CardSummary._bump(status, bucket, card_count, total_balance)
+
+
+@transaction.atomic
+def replace_summary(totals):
+    CardSummary.objects.all().delete()
+    CardSummary.objects.bulk_create(
+        [
+            CardSummary(status=status, bucket=bucket, card_count=card_count, total_balance=total_balance)
+            for (status, bucket), (card_count, total_balance) in sorted(totals.items())
+        ]
+    )
+
+
+def get_summary():
+    rows = list(CardSummary.objects.filter(card_count__gt=0))
+    return {
+        "buckets": [
+            {
+                "status": row.status,
+                "bucket": row.bucket,
+                "count": row.card_count,
+                "total_balance": float(row.total_balance),
+            }
+            for row in rows
+        ],
+        "total_count": sum(row.card_count for row in rows),
+        "total_balance": float(sum((row.total_balance for row in rows), Decimal("0"))),
+    }
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def last_closed_day(now=None):
+    now = now or timezone.now()
+    settled = timezone.localtime(now - timedelta(minutes=OTP_EXPIRY_MINUTES))
+    return settled.date() - timedelta(days=1)
+
+
+def _aggregate_transfers(queryset, period):
+    grouped = (
+        queryset.annotate(period=TRANSFER_PERIODS[period]("created_at"))
+        .order_by()
+        .values("period", "currency", "state")
+        .annotate(
+            transfer_count=Count("pk"),
+            sending_amount=Sum("sending_amount"),
+            receiving_amount=Sum("receiving_amount"),
+        )
+    )
+    partials = fan_out(lambda alias: list(grouped.using(alias)))
+    if len(partials) == 1:
+        return partials[0]
+    merged = {}
+    for row in (row for partial in partials for row in partial):
+        key = (row["period"], row["currency"], row["state"])
+        total = merged.setdefault(
+            key, {**row, "transfer_count": 0, "sending_amount": Decimal("0"), "receiving_amount": Decimal("0")}
+        )
+        total["transfer_count"] += row["transfer_count"]
+        total["sending_amount"] += row["sending_amount"] or 0
+        total["receiving_amount"] += row["receiving_amount"] or 0
+    return list(merged.values())
+
+
+def transfer_summary_rows(card_number=None, start=None, end=None, period="day"):
+    queryset = Transfer.objects.all()
+    if card_number:
+        queryset = queryset.filter(Q(sender_card_number=card_number) | Q(receiver_card_number=card_number))
+    if start:
+        queryset = queryset.filter(created_at__gte=_day_start(start))
+    if end:
+        queryset = queryset.filter(created_at__lt=_day_start(end + timedelta(days=1)))
+
+    rows = []
+    include_live = True
+    if period == "day" and not card_number:
+        rolled_through = TransferDailyRollup.objects.aggregate(day=Max("day"))["day"]
+        if rolled_through and (not start or start <= rolled_through):
+            rollups = TransferDailyRollup.objects.filter(day__lte=rolled_through)
+            if start:
+                rollups = rollups.filter(day__gte=start)
+            if end:
+                rollups = rollups.filter(day__lte=end)
+            rows.extend(
+                rollups.values(
+                    "currency", "state", "transfer_count", "sending_amount", "receiving_amount", period=F("day")
+                )
+            )
+            queryset = queryset.filter(created_at__gte=_day_start(rolled_through + timedelta(days=1)))
+            include_live = not end or end > rolled_through
+    if include_live:
+        rows.extend(_aggregate_transfers(queryset, period))
+
+    return [
+        {
+            "period": row["period"].isoformat(),
+            "currency": row["currency"],
+            "state": row["state"],
+            "count": row["transfer_count"],
+            "sending_amount": float(row["sending_amount"] or 0),
+            "receiving_amount": float(row["receiving_amount"] or 0),
+        }
+        for row in sorted(rows, key=lambda row: (row["period"], row["currency"], row["state"]))
+    ]
+
+
+@transaction.atomic
+def rollup_closed_days(rebuild=False, now=None):
+    if rebuild:
+        TransferDailyRollup.objects.all().delete()
+    last_day = last_closed_day(now)
+    rolled_through = TransferDailyRollup.objects.aggregate(day=Max("day"))["day"]
+    if rolled_through:
+        first_day = rolled_through + timedelta(days=1)
+    else:
+        first_created = [
+            created
+            for created in fan_out(
+                lambda alias: Transfer.objects.using(alias).aggregate(created=Min("created_at"))["created"]
+            )
+            if created is not None
+        ]
+        if not first_created:
+            return 0
+        first_day = timezone.localtime(min(first_created)).date()
+    if first_day > last_day:
+        return 0
+
+    queryset = Transfer.objects.filter(
+        created_at__gte=_day_start(first_day),
+        created_at__lt=_day_start(last_day + timedelta(days=1)),
+    )
+    rollups = [
+        TransferDailyRollup(
+            day=row["period"],
+            currency=row["currency"],
+            state=row["state"],
+            transfer_count=row["transfer_count"],
+            sending_amount=row["sending_amount"] or 0,
+            receiving_amount=row["receiving_amount"] or 0,
+        )
+        for row in _aggregate_transfers(queryset, "day")
+    ]
+    TransferDailyRollup.objects.bulk_create(rollups)
+    return len(rollups)
@@ -1,6 +1,39 @@
-from django.test import SimpleTestCase
+import json
+import logging
+import tempfile
+import logging.handlers
+import shutil
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-from .utils import format_card, format_phone, generate_otp, validate_card
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from .admission import AdmissionController, Overloaded, stats_token
+from .benchmarks import build_simple_xlsx, check_cases, find_regressions, run_benchmarks
+from .cardqueue import CardWriteQueue, LeaderAborted, confirm_transfers
+from .directory import CardDirectory, pack_expire
+from .imports import claim_job, import_card_rows, run_job
+from .logs import BackgroundQueueHandler, JsonFormatter, SamplingFilter
+from .management.commands.import_report import parse_importtime
+from .models import Card, CardImportJob, CardSummary, Error as ErrorMessage, Transfer, TransferDailyRollup
+from .notifier import HttpNotifier, RetryableError, TokenBucket
+from .profiling import profile_token
+from .rpc import dispatch
+from .sharding import TransferShardRouter, merge_sorted, shard_for
+from .stub_gateway import StubGatewayServer
+from .summary import get_summary, rollup_closed_days, transfer_summary_rows
+from .utils import balance_bucket, format_card, format_phone, generate_otp, validate_card
+from .views import _get_error_message
+from .warmup import warm_up
 
 
 class UtilsTests(SimpleTestCase):
@@ -18,3 +51,787 @@ class UtilsTests(SimpleTestCase):
     def test_validate_card(self):
         assert validate_card("4532015112830366") is True
         assert validate_card("4532015112830367") is False
+
+    def test_helper_cases_and_benchmark_gate(self):
+        assert check_cases() == []
+        results = run_benchmarks(["normalize_expire", "read_simple_xlsx"], size=500, repeat=1)
+        assert set(results) == {"normalize_expire", "read_simple_xlsx"}
+        baseline = {"normalize_expire": results["normalize_expire"] / 2, "read_simple_xlsx": None}
+        assert [row[0] for row in find_regressions(results, baseline, 1.5)] == ["normalize_expire"]
+
+    def test_balance_bucket(self):
+        assert balance_bucket(Decimal("0")) == "zero"
+        assert balance_bucket(Decimal("10000")) == "low"
+        assert balance_bucket(Decimal("10000.01")) == "mid"
+        assert balance_bucket(Decimal("1000001")) == "high"
+
+
+class CardSummaryTests(TestCase):
+    def _snapshot(self):
+        return {
+            (row.status, row.bucket): (row.card_count, row.total_balance)
+            for row in CardSummary.objects.filter(card_count__gt=0)
+        }
+
+    def test_summary_tracks_card_writes(self):
+        card = Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("500")
+        )
+        Card.objects.create(
+            card_number="8600123412341234", expire="2030-01", status=Card.STATUS_INACTIVE, balance=Decimal("0")
+        )
+        card.balance = Decimal("20000")
+        card.save()
+        assert self._snapshot() == {
+            ("active", "mid"): (1, Decimal("20000")),
+            ("inactive", "zero"): (1, Decimal("0")),
+        }
+
+        card.delete()
+        assert get_summary()["total_count"] == 1
+
+    def test_rebuild_matches_incremental(self):
+        for index, balance in enumerate(["0", "5", "15000", "2000000", "7"]):
+            Card.objects.create(
+                card_number=f"860012341234{index:04d}", expire="2030-01", status=Card.STATUS_ACTIVE, balance=balance
+            )
+        incremental = self._snapshot()
+        call_command("rebuild_card_summary", workers=1, chunk_size=2, stdout=StringIO())
+        assert self._snapshot() == incremental
+
+
+class TransferSummaryTests(TestCase):
+    def _transfer(self, ext_id, amount, days_ago, state=Transfer.STATE_CONFIRMED, currency=643):
+        transfer = Transfer.objects.create(
+            ext_id=ext_id,
+            sender_card_number="4532015112830366",
+            receiver_card_number="8600123412341234",
+            sender_card_expiry="2030-01",
+            sending_amount=Decimal(amount),
+            currency=currency,
+            receiving_amount=Decimal(amount) * 140,
+            state=state,
+        )
+        Transfer.objects.filter(pk=transfer.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_rollup_matches_live_aggregation(self):
+        self._transfer("t1", "10", 3)
+        self._transfer("t2", "15", 3)
+        self._transfer("t3", "7", 2, state=Transfer.STATE_CANCELLED)
+        self._transfer("t4", "1", 0)
+        live = transfer_summary_rows()
+
+        assert rollup_closed_days() == 2
+        assert TransferDailyRollup.objects.count() == 2
+        assert transfer_summary_rows() == live
+        assert live[0]["count"] == 2
+        assert live[0]["sending_amount"] == 25.0
+
+    def test_expired_transfers_cannot_be_cancelled(self):
+        self._transfer("t1", "10", 2, state=Transfer.STATE_CREATED)
+        request = {"jsonrpc": "2.0", "method": "transfer_cancel", "params": {"ext_id": "t1"}, "id": 1}
+        assert json.loads(dispatch(json.dumps(request)))["error"]["code"] == 32710
+        assert Transfer.objects.get(ext_id="t1").state == Transfer.STATE_CREATED
+
+    def test_card_filter_and_hour_grouping(self):
+        self._transfer("t1", "10", 1)
+        rows = transfer_summary_rows(card_number="8600123412341234", period="hour")
+        assert [row["count"] for row in rows] == [1]
+        assert transfer_summary_rows(card_number="1111222233334444") == []
+
+
+class DispatchTests(TestCase):
+    def _call(self, payload):
+        return json.loads(dispatch(json.dumps(payload).encode()))
+
+    def test_single_call_and_errors(self):
+        Transfer.objects.create(
+            ext_id="t1",
+            sender_card_number="4532015112830366",
+            receiver_card_number="8600123412341234",
+            sender_card_expiry="2030-01",
+            sending_amount=Decimal("1"),
+            currency=643,
+            receiving_amount=Decimal("140"),
+        )
+        response = self._call({"jsonrpc": "2.0", "method": "transfer_state", "params": {"ext_id": "t1"}, "id": 1})
+        assert response == {"jsonrpc": "2.0", "result": {"ext_id": "t1", "state": "created"}, "id": 1}
+        assert self._call({"jsonrpc": "2.0", "method": "transfer_state", "params": {}, "id": 2})["error"]["code"] == -32602
+        assert self._call({"jsonrpc": "2.0", "method": "missing", "id": 3})["error"]["code"] == -32601
+        assert json.loads(dispatch(b"{oops"))["error"]["code"] == -32700
+        assert dispatch(b'{"jsonrpc": "2.0", "method": "transfer_state", "params": ["t1"]}') == ""
+
+    def test_batch_coalesces_state_lookups(self):
+        for ext_id in ("t1", "t2"):
+            Transfer.objects.create(
+                ext_id=ext_id,
+                sender_card_number="4532015112830366",
+                receiver_card_number="8600123412341234",
+                sender_card_expiry="2030-01",
+                sending_amount=Decimal("1"),
+                currency=643,
+                receiving_amount=Decimal("140"),
+            )
+        payload = [
+            {"jsonrpc": "2.0", "method": "transfer_state", "params": {"ext_id": ext_id}, "id": index}
+            for index, ext_id in enumerate(["t1", "t2", "t1"])
+        ]
+        with self.assertNumQueries(1):
+            responses = self._call(payload)
+        assert [response["id"] for response in responses] == [0, 1, 2]
+        assert [response["result"]["ext_id"] for response in responses] == ["t1", "t2", "t1"]
+
+
+class BatchTransferTests(TestCase):
+    def _call(self, method, **params):
+        return json.loads(dispatch(json.dumps({"jsonrpc": "2.0", "method": method, "params": params, "id": 1})))
+
+    def test_create_and_confirm_batch(self):
+        Card.objects.create(
+            card_number="4532015112830366",
+            expire="2030-01",
+            phone="998999730303",
+            status=Card.STATUS_ACTIVE,
+            balance=Decimal("100"),
+        )
+        Card.objects.create(
+            card_number="4111111111111111", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        items = [
+            {"ext_id": "b1", "receiver_card_number": "4111111111111111", "sending_amount": 40, "currency": 643},
+            {"ext_id": "b1", "receiver_card_number": "4111111111111111", "sending_amount": 1, "currency": 643},
+            {"ext_id": "b2", "receiver_card_number": "4111111111111111", "sending_amount": 1, "currency": 978},
+            {"ext_id": "b3", "receiver_card_number": "4111111111111111", "sending_amount": 50, "currency": 643},
+            {"ext_id": "b4", "receiver_card_number": "4111111111111111", "sending_amount": 20, "currency": 643},
+            {"ext_id": "b5", "receiver_card_number": "4111111111111111", "sending_amount": "NaN", "currency": 643},
+        ]
+        result = self._call(
+            "transfer_create_batch",
+            batch_id="batch-1",
+            sender_card_number="4532015112830366",
+            sender_card_expiry="2030-01",
+            transfers=items,
+        )["result"]
+        assert result["accepted"] == 2
+        codes = [item.get("error", {}).get("code") for item in result["items"]]
+        assert codes == [None, 32701, 32707, None, 32702, 32709]
+        assert Transfer.objects.filter(batch_id="batch-1").count() == 2
+        otp = Transfer.objects.filter(batch_id="batch-1").first().otp
+
+        wrong = self._call("transfer_confirm_batch", batch_id="batch-1", otp="000000" if otp != "000000" else "1")
+        assert wrong["error"]["code"] == 32712
+        result = self._call("transfer_confirm_batch", batch_id="batch-1", otp=otp)["result"]
+        assert result["confirmed"] == 2
+        assert Card.objects.get(card_number="4532015112830366").balance == Decimal("10")
+        assert not Transfer.objects.filter(batch_id="batch-1", state=Transfer.STATE_CREATED).exists()
+
+    def test_batch_with_every_item_rejected_lists_the_errors(self):
+        Card.objects.create(
+            card_number="4532015112830366",
+            expire="2030-01",
+            phone="998999730303",
+            status=Card.STATUS_ACTIVE,
+            balance=Decimal("100"),
+        )
+        items = [{"ext_id": "r1", "receiver_card_number": "4111111111111111", "sending_amount": 1, "currency": 643}]
+        result = self._call(
+            "transfer_create_batch",
+            batch_id="batch-rejected",
+            sender_card_number="4532015112830366",
+            sender_card_expiry="2030-01",
+            transfers=items,
+        )["result"]
+        assert (result["accepted"], result["otp_sent"]) == (0, False)
+        assert [item["error"]["code"] for item in result["items"]] == [32706]
+
+    def test_racing_batch_confirm_settles_once(self):
+        Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("100")
+        )
+        Card.objects.create(
+            card_number="4111111111111111", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        pending = [
+            Transfer.objects.create(
+                ext_id=f"race-{index}",
+                batch_id="race",
+                sender_card_number="4532015112830366",
+                receiver_card_number="4111111111111111",
+                sender_card_expiry="2030-01",
+                sending_amount=Decimal("30"),
+                receiving_amount=Decimal("30"),
+                currency=860,
+            )
+            for index in range(2)
+        ]
+        stale = list(Transfer.objects.filter(batch_id="race").order_by("pk"))
+        assert confirm_transfers(pending, all_or_nothing=True) == [None, None]
+        # A second request that read the same 'created' rows earlier must not settle them again.
+        assert confirm_transfers(stale, all_or_nothing=True) == [32706, 32706]
+        assert Card.objects.get(card_number="4532015112830366").balance == Decimal("40")
+
+
+class CardDirectoryTests(TestCase):
+    def test_precheck_and_incremental_refresh(self):
+        sender = Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("100")
+        )
+        directory = CardDirectory()
+        directory.load()
+        assert len(directory) == 1
+        assert directory.precheck("4532015112830366", "2030-01", "8600123412341234") == 32706
+        assert directory.precheck("4532015112830366", "2031-01", "8600123412341234") == 32704
+
+        Card.objects.create(
+            card_number="8600123412341234", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        sender.status = Card.STATUS_INACTIVE
+        sender.save()
+        directory.refresh()
+        assert directory.precheck("4532015112830366", "2030-01", "8600123412341234") == 32705
+        sender.status = Card.STATUS_ACTIVE
+        sender.save()
+        directory.refresh()
+        assert directory.precheck("4532015112830366", "2030-01", "8600123412341234") is None
+
+    def test_precheck_confirms_rejections_against_the_database(self):
+        sender = Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_INACTIVE, balance=Decimal("100")
+        )
+        directory = CardDirectory()
+        directory.load()
+        # Both changes land between polls: a new receiver and a reactivated sender.
+        Card.objects.create(
+            card_number="8600123412341234", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        Card.objects.filter(pk=sender.pk).update(status=Card.STATUS_ACTIVE)
+        with self.assertNumQueries(1):
+            assert directory.precheck("4532015112830366", "2030-01", "8600123412341234") is None
+        with self.assertNumQueries(0):
+            assert directory.precheck("4532015112830366", "2030-01", "8600123412341234") is None
+        assert len(directory) == 2
+        directory.refresh()
+        assert (len(directory._numbers), directory._recent) == (2, {})
+        assert directory.lookup("8600123412341234") == (1, pack_expire("2030-01"))
+
+    def test_refresh_sees_late_commits_and_deletions(self):
+        Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("100")
+        )
+        directory = CardDirectory()
+        directory.load()
+        # A row whose updated_at was stamped before the watermark but committed after it.
+        late = Card.objects.create(
+            card_number="4111111111111111", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        Card.objects.filter(pk=late.pk).update(updated_at=directory._watermark - timedelta(seconds=5))
+        directory.refresh()
+        assert directory.lookup("4111111111111111") is not None
+        late.delete()
+        directory.refresh()
+        assert directory.lookup("4111111111111111") is None
+        assert len(directory) == 1
+
+
+class SeedCommandTests(TestCase):
+    def test_seeded_data_is_valid_and_deterministic(self):
+        call_command("seed_cards", count=40, seed=7, chunk_size=15, stdout=StringIO())
+        call_command("seed_transfers", count=60, seed=7, days=10, chunk_size=25, stdout=StringIO())
+        cards = list(Card.objects.order_by("pk").values_list("card_number", "expire", "phone", "balance"))
+        transfers = list(Transfer.objects.order_by("ext_id").values_list("sender_card_number", "sending_amount"))
+
+        assert all(validate_card(card_number) for card_number, _, _, _ in cards)
+        assert all(len(expire) == 7 and len(phone) in {0, 12} for _, expire, phone, _ in cards)
+        assert get_summary()["total_count"] == 40
+        assert Transfer.objects.filter(created_at__lt=timezone.now() - timedelta(days=1)).exists()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        stdout = StringIO()
+        call_command("reconcile_balances", workers=1, output=str(Path(directory) / "report.csv"), stdout=stdout)
+        assert ": 0 discrepancies" in stdout.getvalue()
+
+        Transfer.objects.all().delete()
+        Card.objects.all().delete()
+        call_command("seed_cards", count=40, seed=7, offset=0, chunk_size=15, stdout=StringIO())
+        call_command("seed_transfers", count=60, seed=7, offset=0, days=10, chunk_size=25, stdout=StringIO())
+        assert list(Card.objects.order_by("pk").values_list("card_number", "expire", "phone", "balance")) == cards
+        assert list(Transfer.objects.order_by("ext_id").values_list("sender_card_number", "sending_amount")) == transfers
+
+
+class NotifierTests(SimpleTestCase):
+    def setUp(self):
+        self.gateway = StubGatewayServer()
+        self.gateway.start()
+        self.addCleanup(self.gateway.server_close)
+        self.addCleanup(self.gateway.shutdown)
+
+    def test_pooled_sends_and_batches(self):
+        notifier = HttpNotifier(self.gateway.url, rate=None, batch_size=50)
+        self.addCleanup(notifier.close)
+        assert notifier.send("telegram", "998991234567", "OTP 123456") is True
+        assert notifier.send_many("chat", ((12345, f"message {index}") for index in range(120))) == 120
+        assert self.gateway.stats == {"connections": 1, "requests": 4, "messages": 121, "batches": 3}
+
+    def test_retries_then_opens_circuit(self):
+        self.gateway.fail_rate = 1.0
+        notifier = HttpNotifier(self.gateway.url, rate=None, retries=2, backoff=0, failure_threshold=2)
+        self.addCleanup(notifier.close)
+        with self.assertLogs("src.notifier", "WARNING") as logs:
+            assert notifier.send("chat", 1, "a") is False
+            assert notifier.send("chat", 1, "b") is False
+            assert notifier.send("chat", 1, "c") is False
+        assert "circuit open" in logs.output[-1]
+        assert self.gateway.stats["requests"] == 0
+        assert self.gateway.stats["connections"] == 1
+
+    def test_token_bucket_limits_burst(self):
+        bucket = TokenBucket(rate=1, burst=2)
+        assert [bucket.acquire() for _ in range(3)] == [True, True, False]
+
+    def test_buckets_are_bounded_and_bad_bodies_fail_the_send(self):
+        notifier = HttpNotifier(self.gateway.url, max_buckets=2)
+        self.addCleanup(notifier.close)
+        for destination in ["a", "b", "a", "c"]:
+            notifier._bucket(destination)
+        assert list(notifier._buckets) == ["a", "c"]
+
+        response = mock.Mock(status=200, will_close=True, read=mock.Mock(return_value=b"<html>"))
+        connection = mock.Mock(sock=None, getresponse=mock.Mock(return_value=response))
+        with mock.patch.object(notifier.pool, "_acquire", return_value=connection):
+            with self.assertLogs("src.notifier", "WARNING") as logs:
+                assert notifier.send("telegram", "998991234567", "OTP 123456") is False
+        assert "invalid body" in logs.output[0]
+
+    def test_backoff_past_the_deadline_fails_the_send(self):
+        notifier = HttpNotifier(self.gateway.url, deadline=0.05, backoff=0.01)
+        self.addCleanup(notifier.close)
+        post_json = mock.Mock(side_effect=RetryableError("refused"))
+        sleep = time.sleep
+        # The first backoff is drawn as zero but the sleep itself overshoots the deadline.
+        with mock.patch.object(notifier.pool, "post_json", post_json), mock.patch("random.uniform", return_value=0.0):
+            with mock.patch("time.sleep", side_effect=lambda delay: sleep(0.06)):
+                with self.assertLogs("src.notifier", "WARNING"):
+                    assert notifier.send("telegram", "998991234567", "OTP 123456") is False
+        assert post_json.call_count == 1
+
+
+class LoggingTests(SimpleTestCase):
+    def _record(self, message, exc_info=None, **extra):
+        record = logging.LogRecord("src.views", logging.ERROR, __file__, 1, message, (), exc_info)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter_masks_card(self):
+        line = JsonFormatter().format(self._record("failed", method="transfer_create", card="8600123412341234"))
+        payload = json.loads(line)
+        assert payload["method"] == "transfer_create"
+        assert payload["card"] == "**** **** **** 1234"
+
+    def test_repeated_exceptions_are_rate_limited(self):
+        sampling = SamplingFilter(exception_limit=2, exception_window=60)
+        try:
+            raise ValueError("boom")
+        except ValueError as exc:
+            exc_info = (type(exc), exc, exc.__traceback__)
+        assert [sampling.filter(self._record("failed", exc_info)) for _ in range(4)] == [True, True, False, False]
+        assert SamplingFilter(rates={"rpc_call": 0.0}).filter(self._record("call", event="rpc_call")) is False
+
+    def test_background_handler_defers_formatting(self):
+        target = logging.handlers.BufferingHandler(10)
+        handler = BackgroundQueueHandler(target=target)
+        handler.setFormatter(JsonFormatter())
+        handler.handle(self._record("hello %s"))
+        handler.stop()
+        assert [record.msg for record in target.buffer] == ["hello %s"]
+
+
+@override_settings(ROOT_URLCONF="src.urls")
+class ProfilingTests(TestCase):
+    def test_signed_header_writes_per_method_profile(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        payload = json.dumps({"jsonrpc": "2.0", "method": "card_summary", "id": 1})
+        with self.settings(RPC_PROFILING={"ENABLED": True, "SAMPLE_RATE": 0.0, "DIR": directory}):
+            self.client.post("/", payload, content_type="application/json")
+            self.client.post("/", payload, content_type="application/json", HTTP_X_RPC_PROFILE="bogus")
+            assert list(Path(directory).glob("*.prof")) == []
+            response = self.client.post(
+                "/", payload, content_type="application/json", HTTP_X_RPC_PROFILE=profile_token()
+            )
+        assert json.loads(response.content)["result"]["total_count"] == 0
+        assert [path.name.split("-")[0] for path in Path(directory).glob("*.prof")] == ["card_summary"]
+
+        out = StringIO()
+        call_command("profile_report", dir=directory, limit=5, stdout=out)
+        assert "card_summary: 1 profiles" in out.getvalue()
+
+
+@override_settings(ROOT_URLCONF="src.urls")
+class AdmissionTests(TestCase):
+    def _controller(self, write=(1, 1, 1.0), read=(1, 1, 1.0)):
+        classes = {
+            kind: {"LIMIT": limit, "QUEUE": queue, "TIMEOUT": timeout}
+            for kind, (limit, queue, timeout) in {"write": write, "read": read}.items()
+        }
+        return AdmissionController(classes, {"transfer_confirm": "write", "transfer_state": "read"}, retry_after=1.0)
+
+    def test_rejects_past_queue_and_sheds_reads_first(self):
+        controller = self._controller()
+        assert controller.classify(["transfer_state", "transfer_confirm"]) == "write"
+        release = threading.Event()
+
+        def hold_then_queue():
+            with controller.admit(["transfer_confirm"]):
+                release.wait()
+
+        holders = [threading.Thread(target=hold_then_queue) for _ in range(2)]
+        for thread in holders:
+            thread.start()
+        while controller.stats()["write"]["waiting"] < 1:
+            time.sleep(0.001)
+
+        with self.assertRaises(Overloaded) as caught:
+            with controller.admit(["transfer_confirm"]):
+                pass
+        assert caught.exception.kind == "write" and caught.exception.retry_after >= 1.0
+        with self.assertRaises(Overloaded):
+            with controller.admit(["transfer_state"]):
+                pass
+        with controller.admit(["missing"]) as kind:
+            assert kind is None
+
+        release.set()
+        for thread in holders:
+            thread.join()
+        stats = controller.stats()
+        assert stats["write"]["admitted"] == 2 and stats["write"]["rejected"] == 1
+        assert stats["read"]["shed"] == 1 and stats["read"]["active"] == 0
+        with controller.admit(["transfer_state"]) as kind:
+            assert kind == "read"
+
+    def test_endpoint_returns_fast_overload_error(self):
+        controller = self._controller(read=(0, 0, 0.0))
+        payload = json.dumps({"jsonrpc": "2.0", "method": "transfer_state", "params": {"ext_id": "t1"}, "id": 1})
+        with mock.patch("src.views.get_admission_controller", return_value=controller):
+            response = self.client.post("/", payload, content_type="application/json")
+            stats_payload = {"jsonrpc": "2.0", "method": "admission_stats", "params": {"token": "forged"}, "id": 2}
+            denied = self.client.post("/", json.dumps(stats_payload), content_type="application/json")
+            stats_payload["params"]["token"] = stats_token()
+            stats = self.client.post("/", json.dumps(stats_payload), content_type="application/json")
+        assert response.status_code == 503
+        assert int(response["Retry-After"]) >= 1
+        assert json.loads(response.content)["error"]["code"] == 32715
+        assert json.loads(denied.content)["error"]["code"] == -32602
+        assert json.loads(stats.content)["result"]["read"]["rejected"] == 1
+
+    def test_batches_take_one_slot_per_call(self):
+        controller = self._controller(read=(3, 0, 0.0))
+        with controller.admit(["transfer_state", "transfer_state"]):
+            assert controller.classes["read"].active == 2
+            with self.assertRaises(Overloaded):
+                with controller.admit(["transfer_state", "transfer_state"]):
+                    pass
+        with controller.admit(["transfer_state"] * 10):
+            assert controller.classes["read"].active == 3
+        assert controller.classes["read"].active == 0
+        call = {"jsonrpc": "2.0", "method": "transfer_state", "params": {"ext_id": "t1"}}
+        response = json.loads(dispatch(json.dumps([dict(call, id=index) for index in range(101)])))
+        assert response["error"]["code"] == -32600
+
+
+@override_settings(TRANSFER_SHARDS=["transfers_0", "transfers_1", "transfers_2"])
+class ShardingTests(SimpleTestCase):
+    def test_shard_for_is_stable_and_spread(self):
+        assert shard_for("ext-1") == shard_for("ext-1")
+        assert {shard_for(f"ext-{index}") for index in range(50)} == {"transfers_0", "transfers_1", "transfers_2"}
+        with self.settings(TRANSFER_SHARDS=[]):
+            assert shard_for("ext-1") == "default"
+
+    def test_router_uses_ext_id_for_new_transfers(self):
+        router = TransferShardRouter()
+        transfer = Transfer(ext_id="ext-7")
+        assert router.db_for_write(Transfer, instance=transfer) == shard_for("ext-7")
+        transfer._state.db = "transfers_1"
+        assert router.db_for_read(Transfer, instance=transfer) == "transfers_1"
+        assert router.db_for_write(Card, instance=Card()) is None
+
+    def test_shards_only_migrate_transfers(self):
+        router = TransferShardRouter()
+        assert router.allow_migrate("transfers_0", "src", model_name="transfer") is True
+        assert router.allow_migrate("transfers_0", "src", model_name="card") is False
+        assert router.allow_migrate("transfers_0", "auth", model_name="user") is False
+        assert router.allow_migrate("default", "src", model_name="card") is None
+
+    def test_merge_sorted_interleaves_shards(self):
+        merged = merge_sorted([[5, 3, 1], [4, 2]], key=lambda value: value, reverse=True)
+        assert merged == [5, 4, 3, 2, 1]
+
+
+class ExportCardsTests(TestCase):
+    def test_delta_export_with_tombstones(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = str(Path(directory) / "cards.csv")
+        watermark = str(Path(directory) / "cards.watermark")
+        kept = Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("1")
+        )
+        removed = Card.objects.create(
+            card_number="8600123412341234", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("1")
+        )
+        options = {"output": output, "watermark_file": watermark, "lag": 0, "tombstones": True, "stdout": StringIO()}
+        call_command("export_cards", **options)
+        with open(output, encoding="utf-8") as handle:
+            assert len(handle.read().splitlines()) == 3
+
+        kept.balance = Decimal("2")
+        kept.save()
+        removed.delete()
+        kept.delete()
+        Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("3")
+        )
+        call_command("export_cards", **options)
+        with open(output, encoding="utf-8") as handle:
+            rows = handle.read().splitlines()
+        assert rows[1:] == [
+            "8600 1234 1234 1234,,,,,delete",
+            "4532 0151 1283 0366,,,,,delete",
+            "4532 0151 1283 0366,2030-01,,active,3.00,upsert",
+        ]
+
+    def test_delta_export_drops_cards_leaving_the_filter(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = str(Path(directory) / "cards.csv")
+        card = Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("1")
+        )
+        since = (timezone.now() - timedelta(seconds=1)).isoformat()
+        options = {"output": output, "since": since, "lag": 0, "overlap": 0, "tombstones": True, "stdout": StringIO()}
+        card.status = Card.STATUS_INACTIVE
+        card.save()
+        call_command("export_cards", status=Card.STATUS_ACTIVE, **options)
+        with open(output, encoding="utf-8") as handle:
+            assert handle.read().splitlines()[1:] == ["4532 0151 1283 0366,,,,,delete"]
+        with self.assertRaises(CommandError):
+            call_command("export_cards", **{**options, "since": "2000-01-01T00:00:00"})
+
+
+class ReconcileBalancesTests(TestCase):
+    def test_reports_discrepancies_and_resumes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = str(Path(directory) / "report.csv")
+        sender = Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("100")
+        )
+        receiver = Card.objects.create(
+            card_number="4111111111111111", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        Transfer.objects.create(
+            ext_id="r1",
+            sender_card_number=sender.card_number,
+            receiver_card_number=receiver.card_number,
+            sender_card_expiry="2030-01",
+            sending_amount=Decimal("10"),
+            currency=643,
+            receiving_amount=Decimal("1400"),
+            state=Transfer.STATE_CONFIRMED,
+        )
+        Card.objects.filter(pk=sender.pk).update(balance=Decimal("90"))
+        Card.objects.filter(pk=receiver.pk).update(balance=Decimal("1399"))
+
+        checkpoint = output + ".checkpoint"
+        with open(checkpoint, "w", encoding="utf-8") as handle:
+            handle.write(json.dumps({"ranges": [[sender.pk, sender.pk + 1], [receiver.pk, receiver.pk + 1]]}) + "\n")
+            handle.write(json.dumps({"range": [sender.pk, sender.pk + 1], "checked": 1, "found": 0}) + "\n")
+        with open(output, "w", encoding="utf-8") as handle:
+            handle.write("card_number,balance,expected,difference\n")
+        stdout = StringIO()
+        call_command("reconcile_balances", output=output, workers=1, stdout=stdout)
+        assert "Checked 2 cards over 2 ranges, 1 ranges resumed: 1 discrepancies" in stdout.getvalue()
+        with open(output, encoding="utf-8") as handle:
+            assert handle.read().splitlines()[1:] == ["4111 1111 1111 1111,1399.00,1400.00,-1.00"]
+        assert not Path(checkpoint).exists()
+
+        call_command("reconcile_balances", rebaseline=True, workers=1, stdout=StringIO())
+        stdout = StringIO()
+        call_command("reconcile_balances", output=output, workers=1, stdout=stdout)
+        assert ": 0 discrepancies" in stdout.getvalue()
+
+        # An Excel import overwrites the balance and restarts the baseline from it.
+        assert import_card_rows([["4111 1111 1111 1111", "2030-01", "", "active", "5000"]]) == (1, [])
+        assert Card.objects.get(pk=receiver.pk).opening_balance == Decimal("3600")
+        stdout = StringIO()
+        call_command("reconcile_balances", output=output, workers=1, stdout=stdout)
+        assert ": 0 discrepancies" in stdout.getvalue()
+
+
+class CardImportJobTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        settings_override = self.settings(MEDIA_ROOT=f"{self.media}/public", CARD_IMPORT_ROOT=f"{self.media}/private")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def _job(self, rows):
+        upload = SimpleUploadedFile("cards.xlsx", build_simple_xlsx(rows))
+        return CardImportJob.objects.create(file=upload, original_name="cards.xlsx")
+
+    def test_checkpointed_import_resumes_after_crash(self):
+        rows = [["card_number", "expire", "phone", "status", "balance"]]
+        rows += [[f"8600 0000 0000 {index:04d}", "01/30", "", "active", "1,000"] for index in range(5)]
+        rows.append(["123", "2030-01", "", "active", "1"])
+        job = self._job(rows)
+        upload = Path(job.file.path)
+        assert upload.is_relative_to(f"{self.media}/private") and upload.exists()
+
+        assert claim_job("worker-a").pk == job.pk
+        assert claim_job("worker-b") is None
+        with mock.patch("src.imports.import_card_rows", side_effect=[(2, []), RuntimeError("db went away")]):
+            with self.assertRaises(RuntimeError):
+                run_job(job, "worker-a", chunk_size=2)
+        job.refresh_from_db()
+        assert (job.status, job.processed_rows, job.total_rows) == (CardImportJob.STATUS_RUNNING, 2, 6)
+
+        CardImportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("run_card_imports", once=True, chunk_size=2, stdout=out)
+        job.refresh_from_db()
+        assert "from row 4" in out.getvalue()
+        assert (job.status, job.processed_rows, job.imported_count, job.error_count) == ("done", 6, 5, 1)
+        assert job.errors == ["Row 7: card_number must be 16 digits"]
+        assert Card.objects.filter(expire="2030-01").count() == 3
+        assert not upload.exists()
+
+    def test_unreadable_file_fails_job(self):
+        upload = SimpleUploadedFile("cards.xlsx", b"not a workbook")
+        job = CardImportJob.objects.create(file=upload, original_name="cards.xlsx")
+        call_command("run_card_imports", once=True, stdout=StringIO())
+        job.refresh_from_db()
+        assert job.status == CardImportJob.STATUS_FAILED
+        assert job.failure.startswith("Cannot read cards.xlsx")
+        assert not Path(job.file.path).exists()
+
+
+class WarmupTests(TestCase):
+    def test_warm_up_loads_caches_once_per_process(self):
+        ErrorMessage.objects.create(code=32702, en="Balance is not enough", ru="-", uz="-")
+        with mock.patch("src.warmup._warmed_pid", None):
+            first = warm_up()
+            second = warm_up()
+        assert set(first) == {"error_messages", "notifier", "card_directory", "connections"}
+        assert first["error_messages"][1] == 1
+        assert set(second) == {"connections"}
+        with self.assertNumQueries(0):
+            assert _get_error_message(32702) == "Balance is not enough"
+        ErrorMessage.objects.filter(code=32702).get().delete()
+        assert _get_error_message(32702) == "Unknown error occurred"
+
+    def test_parse_importtime(self):
+        output = "\n".join(
+            [
+                "import time: self [us] | cumulative | imported package",
+                "import time:       120 |        120 |   encodings.aliases",
+                "import time:       300 |        420 | encodings",
+                "Traceback noise",
+            ]
+        )
+        assert parse_importtime(output) == [("encodings.aliases", 1, 120, 120), ("encodings", 0, 300, 420)]
+
+
+class CardWriteQueueTests(TestCase):
+    def test_queue_coalesces_operations_on_the_same_card(self):
+        release = threading.Event()
+        calls = []
+
+        def execute(payloads):
+            calls.append(payloads)
+            if payloads == ["first"]:
+                release.wait(5)
+            return [payload.upper() for payload in payloads]
+
+        queue = CardWriteQueue(execute, max_batch=10)
+        results = {}
+        leader = threading.Thread(target=lambda: results.update(first=queue.submit("card", "first")))
+        leader.start()
+        while not calls:
+            time.sleep(0.001)
+        followers = [
+            threading.Thread(target=lambda name=name: results.update({name: queue.submit("card", name)}))
+            for name in ["a", "b", "c"]
+        ]
+        for thread in followers:
+            thread.start()
+        while len(queue._pending["card"]) < 3:
+            time.sleep(0.001)
+        assert queue.submit("other", "x") == "X"
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+        assert results == {"first": "FIRST", "a": "A", "b": "B", "c": "C"}
+        assert calls[0] == ["first"] and calls[1] == ["x"] and sorted(calls[2]) == ["a", "b", "c"]
+        assert queue.stats() == {"batches": 3, "operations": 5, "queued_cards": 0}
+
+    def test_followers_are_released_when_the_leader_is_interrupted(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def execute(payloads):
+            started.set()
+            release.wait(5)
+            raise KeyboardInterrupt
+
+        queue = CardWriteQueue(execute, max_batch=10)
+        outcomes = {}
+
+        def submit(name):
+            try:
+                outcomes[name] = queue.submit("card", name)
+            except BaseException as exc:
+                outcomes[name] = type(exc)
+
+        threads = [threading.Thread(target=submit, args=("first",))]
+        threads[0].start()
+        started.wait(5)
+        threads += [threading.Thread(target=submit, args=(name,)) for name in ["a", "b"]]
+        for thread in threads[1:]:
+            thread.start()
+        while len(queue._pending["card"]) < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        assert outcomes == {"first": KeyboardInterrupt, "a": LeaderAborted, "b": LeaderAborted}
+        assert queue.stats()["queued_cards"] == 0
+
+    def test_confirm_transfers_checks_balance_per_operation(self):
+        Card.objects.create(
+            card_number="4532015112830366", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("100")
+        )
+        Card.objects.create(
+            card_number="4111111111111111", expire="2030-01", status=Card.STATUS_ACTIVE, balance=Decimal("0")
+        )
+        transfers = [
+            Transfer.objects.create(
+                ext_id=f"q{index}",
+                sender_card_number="4532015112830366",
+                receiver_card_number="4111111111111111",
+                sender_card_expiry="2030-01",
+                sending_amount=Decimal("60"),
+                receiving_amount=Decimal("60"),
+                currency=643,
+            )
+            for index in range(2)
+        ]
+        assert confirm_transfers([transfers[0], transfers[1], transfers[0]]) == [None, 32702, None]
+        assert Card.objects.get(card_number="4532015112830366").balance == Decimal("40")
+        assert Card.objects.get(card_number="4111111111111111").balance == Decimal("60")
+        assert Transfer.objects.get(ext_id="q0").state == Transfer.STATE_CONFIRMED
+        assert Transfer.objects.get(ext_id="q1").state == Transfer.STATE_CREATED
+        # Confirming again is a no-op rather than a second debit.
+        assert confirm_transfers([transfers[0]]) == [None]
+        assert Card.objects.get(card_number="4532015112830366").balance == Decimal("40")
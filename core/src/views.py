@@ -1,16 +1,32 @@
 import json
 import logging
+import time
 from datetime import date, timedelta
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
-from django.db.models import Q
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import HttpResponse
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from jsonrpcserver import Error, method, dispatch
 
+from .admission import (
+    OVERLOADED,
+    OVERLOADED_MESSAGE,
+    Overloaded,
+    get_admission_controller,
+    retry_after_header,
+    valid_stats_token,
+)
+from .cardqueue import confirm_transfer, confirm_transfers
+from .directory import card_directory
 from .models import Card, Error as ErrorMessage, Transfer
+from .rpc import INVALID_PARAMS, Error, batch, dispatch, method, serialize
+from .sharding import atomic_on, fan_out, group_by_shard, merge_sorted, transfers_for
+from .summary import TRANSFER_PERIODS, get_summary, transfer_summary_rows
 from .utils import (
+    OTP_EXPIRY_MINUTES,
     calculate_exchange,
     format_card,
     format_phone,
@@ -22,11 +38,33 @@ from .utils import (
 )
 
 logger = logging.getLogger(__name__)
-OTP_EXPIRY_MINUTES = 5
+
+
+# Saving or deleting an Error row only resets this process's cache; other workers keep serving
+# the old text until their copy is older than the TTL, so an edit can take up to 5 minutes to show.
+ERROR_MESSAGES_TTL = 300
+_error_messages = {}
+_error_messages_loaded_at = None
+
+
+def load_error_messages():
+    global _error_messages, _error_messages_loaded_at
+    _error_messages = {error.code: error for error in ErrorMessage.objects.all()}
+    _error_messages_loaded_at = time.monotonic()
+    return len(_error_messages)
+
+
+@receiver([post_save, post_delete], sender=ErrorMessage)
+def _error_messages_changed(sender, **kwargs):
+    global _error_messages_loaded_at
+    _error_messages_loaded_at = None
 
 
 def _get_error_message(code, lang="en"):
-    error = ErrorMessage.objects.filter(code=code).first()
+    loaded_at = _error_messages_loaded_at
+    if loaded_at is None or time.monotonic() - loaded_at > ERROR_MESSAGES_TTL:
+        load_error_messages()
+    error = _error_messages.get(code)
     if not error:
         return "Unknown error occurred"
     return getattr(error, lang, error.en)
@@ -36,6 +74,21 @@ def _error(code, lang="en"):
     return Error(code=code, message=_get_error_message(code, lang))
 
 
+def _parse_amount(value):
+    try:
+        amount = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return amount if amount.is_finite() else None
+
+
+def _parse_currency(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 @method
 def transfer_create(
     ext_id,
@@ -51,7 +104,7 @@ def transfer_create(
     try:
         if not ext_id:
             return _error(32700, lang)
-        if Transfer.objects.filter(ext_id=ext_id).exists():
+        if transfers_for(ext_id).filter(ext_id=ext_id).exists():
             return _error(32701, lang)
 
         sender_card_number = format_card(sender_card_number, digits_only=True)
@@ -60,6 +113,9 @@ def transfer_create(
 
         if not validate_card(sender_card_number) or not validate_card(receiver_card_number):
             return _error(32706, lang)
+        error_code = card_directory.precheck(sender_card_number, sender_card_expiry, receiver_card_number)
+        if error_code:
+            return _error(error_code, lang)
 
         sender_card = Card.objects.filter(card_number=sender_card_number).first()
         receiver_card = Card.objects.filter(card_number=receiver_card_number).first()
@@ -87,7 +143,7 @@ def transfer_create(
             return _error(32707, lang)
 
         otp = generate_otp()
-        transfer = Transfer.objects.create(
+        transfer = transfers_for(ext_id).create(
             ext_id=ext_id,
             sender_card_number=sender_card_number,
             receiver_card_number=receiver_card_number,
@@ -100,10 +156,13 @@ def transfer_create(
             otp=otp,
         )
         message = f"Your OTP is {otp} for transfer {transfer.ext_id}."
-        send_telegram_message(transfer.sender_phone, message)
-        return {"ext_id": transfer.ext_id, "state": transfer.state, "otp_sent": True}
+        otp_sent = send_telegram_message(transfer.sender_phone, message)
+        return {"ext_id": transfer.ext_id, "state": transfer.state, "otp_sent": bool(otp_sent)}
     except Exception:
-        logger.exception("transfer.create failed")
+        logger.exception(
+            "transfer.create failed",
+            extra={"event": "rpc_error", "method": "transfer_create", "ext_id": ext_id, "card": sender_card_number},
+        )
         return _error(32706, lang)
 
 
@@ -127,12 +186,166 @@ def transfer_confirm(ext_id, otp, lang="en"):
                 code=32712,
                 message=f"OTP is wrong, left try count is {max(0, 3 - transfer.try_count)}",
             )
-        transfer.state = Transfer.STATE_CONFIRMED
-        transfer.confirmed_at = timezone.now()
-        transfer.save(update_fields=["state", "confirmed_at", "updated_at"])
-        return {"ext_id": transfer.ext_id, "state": transfer.state}
+        # Confirmations for the same sender card queue up and settle together in one transaction.
+        error_code = confirm_transfer(transfer)
+        if error_code:
+            return _error(error_code, lang)
+        return {"ext_id": transfer.ext_id, "state": Transfer.STATE_CONFIRMED}
+    except Exception:
+        logger.exception(
+            "transfer.confirm failed", extra={"event": "rpc_error", "method": "transfer_confirm", "ext_id": ext_id}
+        )
+        return _error(32706, lang)
+
+
+@method
+def transfer_create_batch(batch_id, sender_card_number, sender_card_expiry, transfers, sender_phone="", lang="en"):
+    try:
+        if not batch_id or not isinstance(transfers, list) or not transfers:
+            return _error(32700, lang)
+        if any(fan_out(lambda alias: Transfer.objects.using(alias).filter(batch_id=batch_id).exists())):
+            return _error(32701, lang)
+
+        sender_card_number = format_card(sender_card_number, digits_only=True)
+        sender_card_expiry = normalize_expire(sender_card_expiry)
+        if not validate_card(sender_card_number):
+            return _error(32706, lang)
+        sender_card = Card.objects.filter(card_number=sender_card_number).first()
+        if not sender_card or sender_card.expire != sender_card_expiry:
+            return _error(32704, lang)
+        if sender_card.status != Card.STATUS_ACTIVE:
+            return _error(32705, lang)
+        sender_phone = format_phone(sender_phone or sender_card.phone, digits_only=True)
+        if not sender_phone:
+            return _error(32703, lang)
+
+        items = [item if isinstance(item, dict) else {} for item in transfers]
+        ext_ids = [str(item.get("ext_id") or "") for item in items]
+        receivers = [format_card(item.get("receiver_card_number"), digits_only=True) for item in items]
+        existing = set()
+        for alias, shard_ext_ids in group_by_shard({ext_id for ext_id in ext_ids if ext_id}).items():
+            existing.update(
+                Transfer.objects.using(alias).filter(ext_id__in=shard_ext_ids).values_list("ext_id", flat=True)
+            )
+        receiver_phones = dict(
+            Card.objects.filter(card_number__in=set(receivers)).values_list("card_number", "phone")
+        )
+
+        messages = {}
+        otp = generate_otp()
+        remaining = sender_card.balance
+        seen = set()
+        accepted = []
+        results = []
+        for item, ext_id, receiver_card_number in zip(items, ext_ids, receivers):
+            sending_amount = _parse_amount(item.get("sending_amount"))
+            currency = _parse_currency(item.get("currency"))
+            if not ext_id:
+                error_code = 32700
+            elif ext_id in seen or ext_id in existing:
+                error_code = 32701
+            elif not validate_card(receiver_card_number) or receiver_card_number not in receiver_phones:
+                error_code = 32706
+            elif currency not in {643, 840}:
+                error_code = 32707
+            elif sending_amount is None or sending_amount <= 0:
+                error_code = 32709
+            elif sending_amount > 1_200_000_000:
+                error_code = 32708
+            elif sending_amount > remaining:
+                error_code = 32702
+            else:
+                error_code = None
+            seen.add(ext_id)
+            if error_code:
+                if error_code not in messages:
+                    messages[error_code] = _get_error_message(error_code, lang)
+                results.append({"ext_id": ext_id, "error": {"code": error_code, "message": messages[error_code]}})
+                continue
+            remaining -= sending_amount
+            accepted.append(
+                Transfer(
+                    ext_id=ext_id,
+                    batch_id=batch_id,
+                    sender_card_number=sender_card_number,
+                    receiver_card_number=receiver_card_number,
+                    sender_card_expiry=sender_card_expiry,
+                    sender_phone=sender_phone,
+                    receiver_phone=format_phone(
+                        item.get("receiver_phone") or receiver_phones[receiver_card_number], digits_only=True
+                    ),
+                    sending_amount=sending_amount,
+                    currency=currency,
+                    receiving_amount=calculate_exchange(sending_amount, currency),
+                    otp=otp,
+                )
+            )
+            results.append({"ext_id": ext_id, "state": Transfer.STATE_CREATED})
+
+        otp_sent = False
+        if accepted:
+            shards = group_by_shard(accepted, key=lambda transfer: transfer.ext_id)
+            with atomic_on(shards):
+                for alias, shard_transfers in shards.items():
+                    Transfer.objects.using(alias).bulk_create(shard_transfers)
+            message = f"Your OTP is {otp} for batch {batch_id} of {len(accepted)} transfers."
+            otp_sent = send_telegram_message(sender_phone, message)
+        return {"batch_id": batch_id, "accepted": len(accepted), "otp_sent": bool(otp_sent), "items": results}
     except Exception:
-        logger.exception("transfer.confirm failed")
+        logger.exception(
+            "transfer.create_batch failed",
+            extra={"event": "rpc_error", "method": "transfer_create_batch", "ext_id": batch_id},
+        )
+        return _error(32706, lang)
+
+
+@method
+def transfer_confirm_batch(batch_id, otp, lang="en"):
+    try:
+        transfers = [
+            transfer
+            for shard_transfers in fan_out(
+                lambda alias: list(Transfer.objects.using(alias).filter(batch_id=batch_id).order_by("pk"))
+            )
+            for transfer in shard_transfers
+        ]
+        if not batch_id or not transfers:
+            return _error(32706, lang)
+        pending = [transfer for transfer in transfers if transfer.state == Transfer.STATE_CREATED]
+        items = [{"ext_id": transfer.ext_id, "state": transfer.state} for transfer in transfers]
+        if not pending:
+            return {"batch_id": batch_id, "confirmed": 0, "items": items}
+        try_count = max(transfer.try_count for transfer in pending)
+        if try_count >= 3:
+            return _error(32711, lang)
+        expiry_time = min(transfer.created_at for transfer in pending) + timedelta(minutes=OTP_EXPIRY_MINUTES)
+        if timezone.now() > expiry_time:
+            return _error(32710, lang)
+
+        shards = group_by_shard(pending, key=lambda transfer: transfer.ext_id)
+        if any(transfer.otp != str(otp) for transfer in pending):
+            for alias, shard_transfers in shards.items():
+                Transfer.objects.using(alias).filter(pk__in=[transfer.pk for transfer in shard_transfers]).update(
+                    try_count=F("try_count") + 1, updated_at=timezone.now()
+                )
+            return Error(
+                code=32712,
+                message=f"OTP is wrong, left try count is {max(0, 3 - try_count - 1)}",
+            )
+
+        # The whole batch settles or none of it does; a transfer confirmed or cancelled meanwhile fails it.
+        error_code = next((code for code in confirm_transfers(pending, all_or_nothing=True) if code), None)
+        if error_code:
+            return _error(error_code, lang)
+        for item in items:
+            if item["state"] == Transfer.STATE_CREATED:
+                item["state"] = Transfer.STATE_CONFIRMED
+        return {"batch_id": batch_id, "confirmed": len(pending), "items": items}
+    except Exception:
+        logger.exception(
+            "transfer.confirm_batch failed",
+            extra={"event": "rpc_error", "method": "transfer_confirm_batch", "ext_id": batch_id},
+        )
         return _error(32706, lang)
 
 
@@ -143,12 +356,22 @@ def transfer_cancel(ext_id, lang="en"):
         if not transfer:
             return _error(32706, lang)
         if transfer.state == Transfer.STATE_CREATED:
-            transfer.state = Transfer.STATE_CANCELLED
-            transfer.cancelled_at = timezone.now()
-            transfer.save(update_fields=["state", "cancelled_at", "updated_at"])
+            now = timezone.now()
+            # Expired transfers can no longer change state, so days rolled up by rollup_closed_days stay final.
+            if now > transfer.created_at + timedelta(minutes=OTP_EXPIRY_MINUTES):
+                return _error(32710, lang)
+            cancelled = transfers_for(ext_id).filter(pk=transfer.pk, state=Transfer.STATE_CREATED).update(
+                state=Transfer.STATE_CANCELLED, cancelled_at=now, updated_at=now
+            )
+            if cancelled:
+                transfer.state = Transfer.STATE_CANCELLED
+            else:
+                transfer.refresh_from_db(fields=["state"])
         return {"ext_id": transfer.ext_id, "state": transfer.state}
     except Exception:
-        logger.exception("transfer.cancel failed")
+        logger.exception(
+            "transfer.cancel failed", extra={"event": "rpc_error", "method": "transfer_cancel", "ext_id": ext_id}
+        )
         return _error(32706, lang)
 
 
@@ -160,10 +383,27 @@ def transfer_state(ext_id, lang="en"):
             return _error(32706, lang)
         return {"ext_id": transfer.ext_id, "state": transfer.state}
     except Exception:
-        logger.exception("transfer.state failed")
+        logger.exception(
+            "transfer.state failed", extra={"event": "rpc_error", "method": "transfer_state", "ext_id": ext_id}
+        )
         return _error(32706, lang)
 
 
+@batch("transfer_state")
+def transfer_state_batch(calls):
+    states = {}
+    for alias, ext_ids in group_by_shard({call["ext_id"] for call in calls}).items():
+        states.update(Transfer.objects.using(alias).filter(ext_id__in=ext_ids).values_list("ext_id", "state"))
+    results = []
+    for call in calls:
+        state = states.get(call["ext_id"])
+        if state is None:
+            results.append(_error(32706, call.get("lang", "en")))
+        else:
+            results.append({"ext_id": call["ext_id"], "state": state})
+    return results
+
+
 @method
 def transfer_history(card_number=None, start_date=None, end_date=None, status=None, lang="en"):
     try:
@@ -180,21 +420,64 @@ def transfer_history(card_number=None, start_date=None, end_date=None, status=No
             end = date.fromisoformat(end_date)
             queryset = queryset.filter(created_at__date__lte=end)
 
+        queryset = queryset.order_by("-created_at").values_list("ext_id", "sending_amount", "state", "created_at")
+        rows = merge_sorted(
+            fan_out(lambda alias: list(queryset.using(alias))), key=lambda row: row[3], reverse=True
+        )
         results = [
             {
-                "ext_id": transfer.ext_id,
-                "sending_amount": float(transfer.sending_amount),
-                "state": transfer.state,
-                "created_at": transfer.created_at.isoformat(),
+                "ext_id": ext_id,
+                "sending_amount": float(sending_amount),
+                "state": state,
+                "created_at": created_at.isoformat(),
             }
-            for transfer in queryset
+            for ext_id, sending_amount, state, created_at in rows
         ]
         return results
     except Exception:
-        logger.exception("transfer.history failed")
+        logger.exception(
+            "transfer.history failed",
+            extra={"event": "rpc_error", "method": "transfer_history", "card": card_number},
+        )
         return _error(32706, lang)
 
 
+@method
+def card_summary(lang="en"):
+    try:
+        return get_summary()
+    except Exception:
+        logger.exception("card.summary failed", extra={"event": "rpc_error", "method": "card_summary"})
+        return _error(32706, lang)
+
+
+@method
+def transfer_summary(card_number=None, start_date=None, end_date=None, group_by="day", lang="en"):
+    try:
+        if group_by not in TRANSFER_PERIODS:
+            return _error(32706, lang)
+        return transfer_summary_rows(
+            card_number=format_card(card_number, digits_only=True) if card_number else None,
+            start=date.fromisoformat(start_date) if start_date else None,
+            end=date.fromisoformat(end_date) if end_date else None,
+            period=group_by,
+        )
+    except Exception:
+        logger.exception(
+            "transfer.summary failed",
+            extra={"event": "rpc_error", "method": "transfer_summary", "card": card_number},
+        )
+        return _error(32706, lang)
+
+
+@method
+def admission_stats(token=""):
+    # Operators get a short-lived token from admission.stats_token(); the stats are not public.
+    if not valid_stats_token(token):
+        return Error(code=INVALID_PARAMS, message="Invalid or expired token")
+    return get_admission_controller().stats()
+
+
 @csrf_exempt
 def jsonrpc_endpoint(request):
     if request.method != "POST":
@@ -204,5 +487,19 @@ def jsonrpc_endpoint(request):
             "id": None,
         }
         return HttpResponse(json.dumps(response), content_type="application/json", status=405)
-    response = dispatch(request.body.decode())
+    try:
+        response = dispatch(request.body, admit=get_admission_controller().admit)
+    except Overloaded as exc:
+        logger.warning("rpc %s request shed", exc.kind, extra={"event": "rpc_overloaded", "method": exc.kind})
+        response = {
+            "jsonrpc": "2.0",
+            "error": {"code": OVERLOADED, "message": OVERLOADED_MESSAGE, "data": {"retry_after": exc.retry_after}},
+            "id": None,
+        }
+        return HttpResponse(
+            serialize(response),
+            content_type="application/json",
+            status=503,
+            headers={"Retry-After": retry_after_header(exc.retry_after)},
+        )
     return HttpResponse(response, content_type="application/json")
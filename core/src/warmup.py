@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "CARD_DIRECTORY": True,
+}
+
+_warmed_pid = None
+_lock = threading.Lock()
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "WARMUP", {})}
+
+
+def _error_messages():
+    from .views import load_error_messages
+
+    return load_error_messages()
+
+
+def _card_directory():
+    from .directory import card_directory
+
+    card_directory.refresh()
+    return len(card_directory)
+
+
+def _notifier():
+    from .notifier import get_notifier
+
+    return type(get_notifier()).__name__
+
+
+def _connections():
+    aliases = list(settings.DATABASES)
+    for alias in aliases:
+        connections[alias].ensure_connection()
+    return len(aliases)
+
+
+def warm_up(process_caches=True, open_connections=True):
+    global _warmed_pid
+    config = _config()
+    steps = []
+    with _lock:
+        if process_caches and _warmed_pid != os.getpid():
+            _warmed_pid = os.getpid()
+            steps = [("error_messages", _error_messages), ("notifier", _notifier)]
+            if config["CARD_DIRECTORY"]:
+                steps.append(("card_directory", _card_directory))
+    if open_connections:
+        steps.append(("connections", _connections))
+
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        try:
+            result = step()
+        except Exception:
+            logger.exception("warm-up step %s failed", name, extra={"event": "warmup_failed"})
+            continue
+        timings[name] = (round((time.perf_counter() - started) * 1000, 3), result)
+    logger.info(
+        "worker warm-up took %s",
+        ", ".join(f"{name} {duration}ms" for name, (duration, _) in timings.items()),
+        extra={"event": "warmup", "duration_ms": round(sum(duration for duration, _ in timings.values()), 3)},
+    )
+    return timings
+
+
+def warm_up_in_background():
+    # ASGI servers load the app inside their event loop, where synchronous database calls are refused.
+    # Requests run on other threads with their own connections, so only the process caches are loaded.
+    def run():
+        try:
+            warm_up(open_connections=False)
+        finally:
+            connections.close_all()
+
+    threading.Thread(target=run, name="warm-up", daemon=True).start()